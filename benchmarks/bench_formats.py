@@ -0,0 +1,60 @@
+"""Snapshot size, dump and parse time per format, by collection size.
+
+    python benchmarks/bench_formats.py --counts 10000 50000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_notes import CATEGORIES, make_notes  # noqa: E402
+from muze import codecs  # noqa: E402
+from muze.repository import prepare_note  # noqa: E402
+
+
+def best_of(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def load(codec, blob):
+    """Parse plus the tuple conversion the repository does on load, with the
+    garbage collector paused like JournalStore.load does."""
+    gc.disable()
+    try:
+        for note in codec.loads(blob)["notes"]:
+            prepare_note(note)
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--body-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("orjson: %s" % ("yes" if codecs.orjson is not None else "no (standard library json)"))
+    print("%8s %-12s %10s %10s %10s" % ("notes", "format", "size MB", "dump ms", "load ms"))
+    for count in args.counts:
+        notes = make_notes(count, args.body_size, seed=count)
+        for note in notes:
+            note["rev"] = 1
+        data = {"notes": notes, "category_colors": {category: [0.5, 0.7, 0.8, 1] for category in CATEGORIES}}
+        for name, codec in codecs.CODECS.items():
+            blob = codec.dumps(data)
+            dump_ms = best_of(lambda: codec.dumps(data), args.repeat)
+            load_ms = best_of(lambda: load(codec, blob), args.repeat)
+            print("%8d %-12s %10.2f %10.1f %10.1f" % (count, name, len(blob) / 1e6, dump_ms, load_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Time to open the note editor: building the dialog every time vs reusing it.
+
+Run from the repo root (use xvfb-run on a machine without a display):
+
+    python benchmarks/bench_note_dialog.py --opens 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")  # Keep Kivy from eating our CLI flags
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kivy.base import EventLoop  # noqa: E402
+from kivy.core.window import Window  # noqa: E402
+
+from muze.storage import new_note_id  # noqa: E402
+from note2 import NotesApp  # noqa: E402
+
+
+def frame():
+    EventLoop.idle()
+
+
+def time_opens(app, note, opens, rebuild):
+    """Open and close the editor ``opens`` times; ms until the first frame with it up."""
+    times = []
+    for _ in range(opens):
+        if rebuild:
+            app.dialog = None  # What every open used to do
+        start = time.perf_counter()
+        app.edit_note(note)
+        frame()
+        times.append((time.perf_counter() - start) * 1000)
+        app.close_dialog()
+        for _ in range(3):
+            frame()  # Let the dismiss animation finish
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--opens", type=int, default=50)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # The app opens its files in the working directory
+        try:
+            run(args)
+        finally:
+            os.chdir(cwd)
+
+
+def run(args):
+    app = NotesApp()
+    EventLoop.ensure_window()
+    Window.add_widget(app.build())
+    for _ in range(5):
+        frame()
+
+    note = {
+        "id": new_note_id(),
+        "title": "A note",
+        "url": "https://example.com",
+        "notes": "Some text\n" * 50,
+        "category": "work",
+        "favorite": True,
+    }
+    for label, rebuild in (("rebuilt each open", True), ("built once", False)):
+        times = sorted(time_opens(app, note, args.opens, rebuild))
+        print("%-18s median %.1f ms, p95 %.1f ms" % (
+            label + ":", statistics.median(times), times[int(len(times) * 0.95)]))
+
+
+if __name__ == "__main__":
+    main()
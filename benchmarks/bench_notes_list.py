@@ -0,0 +1,80 @@
+"""Frame time of the notes list while scrolling through a large collection.
+
+Run from the repo root (use xvfb-run on a machine without a display):
+
+    python benchmarks/bench_notes_list.py --notes 10000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")  # Keep Kivy from eating our CLI flags
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kivy.base import EventLoop  # noqa: E402
+from kivy.core.window import Window  # noqa: E402
+
+from benchmarks.generate_notes import make_notes  # noqa: E402
+from muze.repository import prepare_note  # noqa: E402
+from note2 import NotesApp  # noqa: E402
+
+
+def frame():
+    """Run one frame of the event loop and return how long it took in ms."""
+    start = time.perf_counter()
+    EventLoop.idle()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--body-size", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # The app opens its files in the working directory
+        try:
+            run(args)
+        finally:
+            os.chdir(cwd)
+
+
+def run(args):
+    app = NotesApp()
+    EventLoop.ensure_window()
+    root = app.build()
+    Window.add_widget(root)
+    for _ in range(5):
+        frame()  # Let the first layout pass settle
+
+    notes = [prepare_note(note) for note in make_notes(args.notes, args.body_size, seed=0)]
+    start = time.perf_counter()
+    app.show_notes(notes)
+    frame()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # Scroll top to bottom, one frame per step
+    frame_times = []
+    for i in range(args.frames):
+        app.notes_view.scroll_y = 1 - i / float(args.frames - 1)
+        frame_times.append(frame())
+
+    frame_times.sort()
+    print("notes:            %d" % args.notes)
+    print("load + 1st frame: %.1f ms" % load_ms)
+    print("card widgets:     %d" % len(app.notes_grid.children))
+    print("frame median:     %.2f ms" % statistics.median(frame_times))
+    print("frame p95:        %.2f ms" % frame_times[int(len(frame_times) * 0.95)])
+    print("frame max:        %.2f ms" % frame_times[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Search latency of the full-text index against the old linear scan.
+
+    python benchmarks/bench_search.py --notes 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_notes import make_notes  # noqa: E402
+from muze.search import SearchIndex  # noqa: E402
+
+QUERIES = ["a", "no", "kivy", "note 4999", "gamma delta", "andr*", "e.g", "zzzz"]
+
+
+def linear_scan(notes, value):
+    """The search on_search_text used to do on every keystroke."""
+    return [
+        note for note in notes
+        if (
+            value.lower() in note["title"].lower() or
+            value.lower() in note.get("category", "").lower() or
+            value.lower() in note.get("notes", "").lower()
+        )
+    ]
+
+
+def timed(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--body-size", type=int, default=200)
+    args = parser.parse_args()
+
+    notes = make_notes(args.notes, args.body_size, seed=0)
+    index = SearchIndex()
+    index.rebuild(notes)
+    build_ms, _ = timed(lambda: index.search("x"), repeat=1)  # First search indexes everything
+    print("notes: %d, first search (builds index): %.1f ms" % (args.notes, build_ms))
+    print("%-14s %8s %10s %10s" % ("query", "hits", "index ms", "scan ms"))
+    for query in QUERIES:
+        index_ms, hits = timed(lambda: index.search(query))
+        scan_ms, _ = timed(lambda: linear_scan(notes, query), repeat=1)
+        print("%-14s %8d %10.2f %10.2f" % (query, len(hits), index_ms, scan_ms))
+
+
+if __name__ == "__main__":
+    main()
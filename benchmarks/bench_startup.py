@@ -0,0 +1,52 @@
+"""Cold start: time until the first screen of notes is loaded, by collection size.
+
+    python benchmarks/bench_startup.py --counts 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_notes import STARTUP_PAGE, make_notes  # noqa: E402
+from muze.repository import prepare_note  # noqa: E402
+from muze.sqlite_repository import SqliteNoteRepository  # noqa: E402
+
+
+def fill(path, count, body_size):
+    repository = SqliteNoteRepository(path)
+    repository.load()
+    for note in make_notes(count, body_size, seed=0):
+        repository.put_note(prepare_note(note))
+    repository.close()
+
+
+def timed_load(path, limit):
+    start = time.perf_counter()
+    repository = SqliteNoteRepository(path)
+    repository.load(limit=limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    repository.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--body-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print("%8s %14s %14s" % ("notes", "first page ms", "everything ms"))
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "notes.db")
+            fill(path, count, args.body_size)
+            lazy_ms = timed_load(path, STARTUP_PAGE)
+            full_ms = timed_load(path, None)
+        print("%8d %14.1f %14.1f" % (count, lazy_ms, full_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Write a synthetic notes.json for benchmarks.
+
+    python benchmarks/generate_notes.py --notes 10000 --body-size 500 --output notes.json
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from muze.storage import new_note_id  # noqa: E402
+
+CATEGORIES = ["work", "home", "ideas", "reading", "travel", "recipes", ""]
+STARTUP_PAGE = 60  # NotesApp.startup_page
+COMMON_WORDS = ["alpha", "beta", "gamma", "delta", "kivy", "note", "muze", "android", "list", "card"]
+
+
+def make_vocabulary(size=5000, rng=random):
+    """Random words plus a few common ones, so searches hit both rare and frequent terms."""
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+             for _ in range(size)]
+    return words + COMMON_WORDS * (size // 100 + 1)
+
+
+def make_notes(count, body_size=500, favorite_ratio=0.1, seed=None):
+    """``count`` notes in the app's format, bodies of about ``body_size`` characters."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng=rng)
+    notes = []
+    for i in range(count):
+        words, length = [], 0
+        while length < body_size:
+            word = rng.choice(vocabulary)
+            words.append(word)
+            length += len(word) + 1
+        notes.append({
+            "id": new_note_id(),
+            "title": "Note %d %s" % (i, rng.choice(vocabulary)),
+            "url": "https://example.com/%d" % i if rng.random() < 0.3 else "",
+            "notes": " ".join(words),
+            "category": rng.choice(CATEGORIES),
+            "color": [rng.random(), rng.random(), rng.random(), 1],
+            "favorite": rng.random() < favorite_ratio,
+        })
+    return notes
+
+
+def write_notes_json(path, count, body_size=500, favorite_ratio=0.1, seed=None):
+    notes = make_notes(count, body_size, favorite_ratio, seed)
+    category_colors = {category: [0.5, 0.7, 0.8, 1] for category in CATEGORIES}
+    with open(path, "w") as f:
+        json.dump({"notes": notes, "category_colors": category_colors}, f, indent=4)
+    return notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--body-size", type=int, default=500)
+    parser.add_argument("--favorites", type=float, default=0.1, help="share of notes marked favorite")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="notes.json")
+    args = parser.parse_args()
+
+    write_notes_json(args.output, args.notes, args.body_size, args.favorites, args.seed)
+    print("wrote %d notes to %s (%.1f MB)" % (args.notes, args.output, os.path.getsize(args.output) / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Benchmark suite for the app's hot paths, with machine-readable results.
+
+Times, for each collection size and storage backend: loading, saving an
+edit, search, ranked search and building the notes list. Results are written as JSON so
+runs from different releases can be compared:
+
+    python benchmarks/run_suite.py --counts 1000 10000 --output results.json
+    python benchmarks/run_suite.py --counts 1000 10000 --compare results.json
+
+The list benchmark needs Kivy and a window (use xvfb-run on a machine
+without a display); it is reported as skipped when Kivy can't start.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")  # Keep Kivy from eating our CLI flags
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate_notes import STARTUP_PAGE, write_notes_json  # noqa: E402
+from muze.ranking import query_terms  # noqa: E402
+from muze.repository import JsonNoteRepository  # noqa: E402
+from muze.sqlite_repository import SqliteNoteRepository  # noqa: E402
+
+QUERIES = ["a", "kivy", "note 42", "gamma delta", "andr*", "zzzz"]
+RANK_QUERIES = ["k", "kivy", "andriod", "note 42", "alpah gamma"]  # Ranked search, typos included
+
+
+def timed(func, repeat):
+    """Median wall time of ``func()`` in ms, and its last result."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def open_repository(backend, directory, json_path):
+    if backend == "sqlite":
+        return SqliteNoteRepository(os.path.join(directory, "notes.db"), import_from=json_path)
+    return JsonNoteRepository(json_path)
+
+
+def bench_backend(backend, directory, json_path, repeat):
+    """Yields ``(benchmark, ms)`` for one backend on the notes in json_path."""
+    if backend == "sqlite":
+        start = time.perf_counter()
+        repository = open_repository(backend, directory, json_path)
+        repository.load(limit=0)  # Imports notes.json
+        repository.close()
+        yield "import", (time.perf_counter() - start) * 1000
+
+        def first_page():
+            repository = open_repository(backend, directory, json_path)
+            repository.load(limit=STARTUP_PAGE)
+            repository.close()
+        yield "load_first_page", timed(first_page, repeat)[0]
+
+    def load():
+        repository = open_repository(backend, directory, json_path)
+        repository.load()
+        return repository
+    yield "load", timed(lambda: load().close(), repeat)[0]
+    repository = load()
+
+    notes = repository.notes
+    edits = iter(range(repeat * 10))
+
+    def save():
+        note = notes[next(edits) * 7919 % len(notes)]  # Spread edits over the collection
+        note["title"] = note["title"] + "!"
+        repository.put_note(note)
+        repository.flush()
+    yield "save_one", timed(save, repeat * 10)[0]
+
+    if backend == "json":
+        def snapshot():
+            repository.store.compact()
+            repository.store._compactor.join()
+        yield "save_snapshot", timed(snapshot, repeat)[0]
+        yield "search_index_build", timed(lambda: repository.search("x"), 1)[0]
+
+    for query in QUERIES:
+        yield "search[%s]" % query, timed(lambda: repository.search(query), repeat)[0]
+    for query in RANK_QUERIES:
+        yield "rank[%s]" % query, timed(lambda: repository.rank(query_terms(query)), repeat)[0]
+    yield "favorites", timed(repository.favorites, repeat)[0]
+    repository.close()
+
+
+def bench_grid(json_path, repeat):
+    """Time to hand every note to the list and lay out the first screen."""
+    from kivy.base import EventLoop
+    from kivy.core.window import Window
+
+    from note2 import NotesApp
+
+    with open(json_path) as f:
+        notes = json.load(f)["notes"]
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(json_path))  # The app opens its files in the working directory
+    try:
+        app = NotesApp()
+    finally:
+        os.chdir(cwd)
+    EventLoop.ensure_window()
+    Window.add_widget(app.build())
+    for _ in range(5):
+        EventLoop.idle()
+
+    def build_grid():
+        app.card_cache.clear()  # Measure building rows, not the cache
+        app.show_notes(notes)
+        EventLoop.idle()
+    ms = timed(build_grid, repeat)[0]
+    app.repository.close()
+    return ms
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(counts, body_size, backends, repeat, grid):
+    results = []
+    for count in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "notes.json")
+            write_notes_json(json_path, count, body_size, seed=count)
+            for backend in backends:
+                for benchmark, ms in bench_backend(backend, directory, json_path, repeat):
+                    results.append({"benchmark": benchmark, "backend": backend, "notes": count,
+                                    "body_size": body_size, "ms": round(ms, 3)})
+                    print("%-8s %8d  %-22s %10.2f ms" % (backend, count, benchmark, ms), file=sys.stderr)
+            if grid:
+                try:
+                    ms = bench_grid(json_path, repeat)
+                except Exception as e:  # No Kivy, or no display to open a window on
+                    print("grid: skipped (%s)" % e, file=sys.stderr)
+                    grid = False
+                else:
+                    results.append({"benchmark": "grid_build", "backend": None, "notes": count,
+                                    "body_size": body_size, "ms": round(ms, 3)})
+                    print("%-8s %8d  %-22s %10.2f ms" % ("ui", count, "grid_build", ms), file=sys.stderr)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print results that got slower than ``threshold`` times the baseline;
+    returns how many did."""
+    def key(result):
+        return result["benchmark"], result["backend"], result["notes"], result["body_size"]
+
+    before = {key(result): result["ms"] for result in baseline["results"]}
+    regressions = 0
+    for result in report["results"]:
+        old = before.get(key(result))
+        if not old:
+            continue
+        ratio = result["ms"] / old
+        if ratio > threshold:
+            regressions += 1
+            print("slower: %s %s %d notes: %.2f -> %.2f ms (x%.2f)" % (
+                result["backend"], result["benchmark"], result["notes"], old, result["ms"], ratio),
+                file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--body-size", type=int, default=500)
+    parser.add_argument("--backends", nargs="+", default=["json", "sqlite"], choices=["json", "sqlite"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-grid", action="store_true", help="skip the Kivy list benchmark")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to check against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="with --compare, how many times slower counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.counts, args.body_size, args.backends, args.repeat, not args.no_grid)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Non-UI building blocks for the Muze notes app."""
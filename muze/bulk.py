@@ -0,0 +1,314 @@
+"""Bulk changes, export and import without blocking the UI.
+
+Reading and writing files happens on a worker thread. Changes to the
+repository stay on the main thread (the UI reads it there) but are applied
+a batch per frame, all inside one repository batch, so listeners see a
+single NOTES_CHANGED at the end and the store flushes once.
+
+Export/import formats:
+
+- JSON Lines: one note per line, the note dict as stored.
+- Markdown folder: one ``.md`` file per note; the title as a heading, the
+  body below it, and the other fields in a front matter block with one
+  ``key: <json value>`` line each.
+"""
+import os
+import queue
+import re
+import shutil
+import threading
+from functools import partial
+
+from kivy.clock import Clock
+
+from .codecs import dumps_json, loads_json
+from .storage import atomic_write, new_note_id
+
+BATCH_SIZE = 200  # Notes applied per frame
+_NOT_EXPORTED = ("preview", "rev")  # Derived or local to this install
+
+
+def _exported(note):
+    return {key: value for key, value in note.items() if key not in _NOT_EXPORTED}
+
+
+def write_jsonl(notes, path, report=None, cancelled=None):
+    """Write notes (any iterable) to a JSON Lines file; returns how many."""
+    count = 0
+
+    def write(f):
+        nonlocal count
+        for note in notes:
+            if cancelled is not None and cancelled():
+                raise Cancelled()
+            f.write(dumps_json(_exported(note)).encode("utf-8") + b"\n")
+            count += 1
+            if report is not None and count % BATCH_SIZE == 0:
+                report(count)
+    atomic_write(path, write, mode="wb")
+    return count
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield loads_json(line)
+
+
+def _slug(title):
+    slug = re.sub(r"[^\w-]+", "-", title.lower(), flags=re.UNICODE).strip("-")
+    return slug[:40] or "note"
+
+
+def note_to_markdown(note):
+    lines = ["---"]
+    for key, value in _exported(note).items():
+        if key not in ("title", "notes"):
+            lines.append("%s: %s" % (key, dumps_json(value)))
+    lines += ["---", "# " + note.get("title", ""), "", note.get("notes", "")]
+    return "\n".join(lines) + "\n"
+
+
+def markdown_to_note(text):
+    note = {}
+    lines = text.split("\n")
+    i = 0
+    if lines and lines[0] == "---":
+        for i in range(1, len(lines)):
+            if lines[i] == "---":
+                break
+            key, _, value = lines[i].partition(": ")
+            try:
+                note[key] = loads_json(value)
+            except ValueError:
+                note[key] = value  # Hand-edited; keep the text
+        i += 1
+    if i < len(lines) and lines[i].startswith("# "):
+        note["title"] = lines[i][2:]
+        i += 1
+        if i < len(lines) and not lines[i]:
+            i += 1  # Blank line after the heading
+    body = "\n".join(lines[i:])
+    note["notes"] = body[:-1] if body.endswith("\n") else body  # The newline note_to_markdown ends with
+    note.setdefault("title", "")
+    return note
+
+
+def write_markdown(notes, directory, report=None, cancelled=None):
+    """Write one Markdown file per note into ``directory``, replacing what's
+    there once every file is written; returns how many."""
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    count = 0
+    for note in notes:
+        if cancelled is not None and cancelled():
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise Cancelled()
+        name = "%s-%s.md" % (_slug(note.get("title", "")), note["id"][:8])
+        with open(os.path.join(tmp_directory, name), "w", encoding="utf-8", newline="") as f:
+            f.write(note_to_markdown(note))
+        count += 1
+        if report is not None and count % BATCH_SIZE == 0:
+            report(count)
+    old_directory = directory + ".old"
+    if os.path.exists(directory):
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    return count
+
+
+def read_markdown(directory):
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".md"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8", newline="") as f:
+                yield markdown_to_note(f.read())
+
+
+def read_notes(path):
+    """Notes from a JSON Lines file or a Markdown folder."""
+    if os.path.isdir(path):
+        return read_markdown(path)
+    return read_jsonl(path)
+
+
+class Cancelled(Exception):
+    pass
+
+
+class _Progress:
+    """Hands the latest ``(done, total)`` to the main thread, at most once a frame."""
+
+    def __init__(self, on_progress):
+        self._on_progress = on_progress
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def __call__(self, done, total=None):
+        if self._on_progress is None:
+            return
+        with self._lock:
+            scheduled = self._latest is not None
+            self._latest = (done, total)
+        if not scheduled:
+            Clock.schedule_once(self._deliver)
+
+    def _deliver(self, dt):
+        with self._lock:
+            latest, self._latest = self._latest, None
+        if latest is not None:
+            self._on_progress(*latest)
+
+
+class BackgroundTask:
+    """Runs ``work(report, cancelled)`` on a worker thread.
+
+    ``report(done, total=None)`` may be called from the worker as often as it
+    likes; ``on_progress(done, total)`` runs on the main thread with the
+    latest numbers. ``on_done(result, error)`` runs on the main thread at the
+    end; error is None on success and a Cancelled after ``cancel()``.
+    """
+
+    def __init__(self, work, on_progress=None, on_done=None):
+        self._work = work
+        self._report = _Progress(on_progress)
+        self._on_done = on_done
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="background-task", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        result = error = None
+        try:
+            result = self._work(self._report, self._cancelled.is_set)
+        except Exception as e:  # Handed to on_done on the main thread
+            error = e
+        if self._on_done is not None:
+            Clock.schedule_once(partial(self._finish, result, error))
+
+    def _finish(self, result, error, dt):
+        self._on_done(result, error)
+
+
+class BulkJob:
+    """Applies ``apply(item)`` to many items without blocking the main loop.
+
+    The items are iterated on a worker thread (so reading them from a file
+    doesn't block) and handed over through a small queue; the main thread
+    applies one batch per frame inside a single ``repository`` batch.
+    ``on_progress(done, total)`` and ``on_done(count, error)`` run on the main
+    thread; ``total`` is None when the number of items isn't known up front.
+    An exception from reading or from ``apply`` ends the job and is handed
+    to ``on_done``.
+    """
+
+    def __init__(self, repository, items, apply, total=None, on_progress=None, on_done=None,
+                 batch_size=BATCH_SIZE):
+        self.repository = repository
+        self._items = items
+        self._apply = apply
+        self._total = total
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=4)  # Keeps a fast reader from running far ahead
+        self._cancelled = threading.Event()
+        self._done = 0
+        self._error = None
+        self._event = None
+
+    def start(self):
+        self.repository.begin_batch()
+        threading.Thread(target=self._read, name="bulk-read", daemon=True).start()
+        self._event = Clock.schedule_interval(self._step, 0)
+        return self
+
+    def cancel(self):
+        """Stop after the current batch; what's applied so far stays."""
+        self._cancelled.set()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        batch = []
+        try:
+            for item in self._items:
+                batch.append(item)
+                if len(batch) >= self._batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch:
+                self._put(batch)
+        except Exception as e:  # A bad file; reported once the queue drains
+            self._error = e
+        self._put(None)
+
+    def _step(self, dt):
+        try:
+            batch = self._queue.get_nowait()
+        except queue.Empty:
+            if not self._cancelled.is_set():
+                return
+            batch = None
+        if batch is not None and not self._cancelled.is_set():
+            try:
+                for item in batch:
+                    self._apply(item)
+                    self._done += 1
+            except Exception as e:  # A bad item; keep what's applied, stop the reader too
+                self._error = e
+                self._cancelled.set()
+                self._finish()
+                return
+            if self._on_progress is not None:
+                self._on_progress(self._done, self._total)
+            return
+        self._finish()
+
+    def stop(self):
+        """Cancel and wrap up right away, e.g. when the app is closing."""
+        if self._event is not None:
+            self._cancelled.set()
+            self._finish()
+
+    def _finish(self):
+        self._event.cancel()
+        self._event = None
+        self.repository.end_batch()  # One flush, one NOTES_CHANGED
+        if self._on_done is not None:
+            error = self._error
+            if error is None and self._cancelled.is_set():
+                error = Cancelled()
+            self._on_done(self._done, error)
+
+
+def import_note(repository, note):
+    """Add an imported note, or update the note with its id if there is one."""
+    note.pop("preview", None)
+    note.pop("rev", None)
+    if not note.get("id"):
+        note["id"] = new_note_id()
+    note.setdefault("notes", "")
+    existing = repository.get(note["id"])
+    if existing is not None:
+        repository.load_body(existing)  # Keeps the URL if the import has none
+        existing.update(note)
+        note = existing
+    repository.put_note(note)
+    return note
@@ -0,0 +1,103 @@
+"""Categories in use, with note counts, for autocomplete and filtering."""
+from bisect import bisect_left, insort
+
+
+class CategoryIndex:
+    """Note counts per category, kept up to date as notes are saved and deleted.
+
+    Category names are also kept sorted, so the categories starting with a
+    prefix are a binary search away; ``complete`` ranks them by how many notes
+    use them. Categories that only have a color saved count as in use with
+    zero notes, so they still get suggested.
+
+    The notes of each category are kept too, for backends that filter in
+    memory. A backend that counts in the database can ``rebuild`` from its
+    counts and ``track`` notes as it hands them out, so later edits can tell
+    which category a note is moving out of.
+    """
+
+    def __init__(self):
+        self._counts = {}  # category -> number of notes
+        self._names = []  # Every known category except "", sorted
+        self._members = {}  # category -> {note id: note}
+        self._category_of = {}  # note id -> category it's counted under
+        self._seq = {}  # note id -> first time seen, for display order
+        self._next_seq = 0
+
+    def rebuild(self, notes, categories=(), counts=None):
+        """Start over from the given notes and extra (say, colored) categories.
+        ``counts`` overrides counting the notes, when they aren't all loaded."""
+        self.__init__()
+        for note in notes:
+            self.track(note)
+        if counts is None:
+            counts = {}
+            for category in self._category_of.values():
+                counts[category] = counts.get(category, 0) + 1
+        self._counts = dict(counts)
+        self._names = sorted(name for name in set(self._counts).union(categories) if name)
+
+    def _known(self, category):
+        i = bisect_left(self._names, category)
+        return i < len(self._names) and self._names[i] == category
+
+    def count(self, category):
+        return self._counts.get(category, 0)
+
+    def add_name(self, category):
+        """Know about a category before any note uses it."""
+        if category and not self._known(category):
+            insort(self._names, category)
+
+    def track(self, note):
+        """Remember a note's category without counting it again."""
+        note_id = note["id"]
+        category = note.get("category", "")
+        old = self._category_of.get(note_id)
+        if old is not None and old != category:
+            self._members.get(old, {}).pop(note_id, None)
+        self._category_of[note_id] = category
+        self._members.setdefault(category, {})[note_id] = note
+        if note_id not in self._seq:
+            self._seq[note_id] = self._next_seq
+            self._next_seq += 1
+
+    def put(self, note):
+        """Count a new note, or move an edited one to its new category."""
+        old = self._category_of.get(note["id"])
+        category = note.get("category", "")
+        self.track(note)
+        if old == category:
+            return
+        if old is not None:
+            self._counts[old] -= 1
+        self._counts[category] = self._counts.get(category, 0) + 1
+        self.add_name(category)
+
+    def remove(self, note):
+        note_id = note["id"]
+        category = self._category_of.pop(note_id, None)
+        if category is None:
+            category = note.get("category", "")  # Never tracked; counted by a rebuild
+        else:
+            self._members.get(category, {}).pop(note_id, None)
+        self._seq.pop(note_id, None)
+        if self._counts.get(category, 0) > 0:
+            self._counts[category] -= 1
+
+    def notes(self, category):
+        """The notes in a category, in the order they were first seen."""
+        members = self._members.get(category, {})
+        return sorted(members.values(), key=lambda note: self._seq[note["id"]])
+
+    def complete(self, prefix, limit=8):
+        """Categories starting with ``prefix``, most used first; the first
+        ``limit`` of them, or all of them if ``limit`` is None."""
+        prefix = prefix.strip().lower()
+        matches = []
+        for name in self._names[bisect_left(self._names, prefix):]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        matches.sort(key=lambda name: (-self._counts.get(name, 0), name))
+        return matches[:limit]
@@ -0,0 +1,178 @@
+"""File formats for the notes snapshot, picked by name and detected on read.
+
+- ``json``: compact JSON, no indentation. Uses orjson when it's installed.
+- ``json-pretty``: the indented JSON notes.json was always written in.
+- ``columnar``: binary. Text fields are stored one JSON array per field,
+  colors as packed doubles, favorites as flag bytes and revisions as ints,
+  so loading builds color tuples straight from the packed array. Smallest
+  of the three; compact JSON through orjson still parses fastest.
+
+Whatever the app is set to write, any of them is read; JournalStore rewrites
+a snapshot in another format in its own right after loading it.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library does the same, slower
+    orjson = None
+
+
+def dumps_json(obj):
+    """Compact JSON text, with orjson if available."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def loads_json(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+class JsonCodec:
+    format = "json"
+
+    def __init__(self, indent=None):
+        self.name = "json-pretty" if indent else "json"
+        self.indent = indent
+
+    def dumps(self, data):
+        if self.indent:
+            return json.dumps(data, indent=self.indent).encode("utf-8")
+        if orjson is not None:
+            return orjson.dumps(data)
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, blob):
+        return loads_json(blob)
+
+
+class ColumnarCodec:
+    """Binary snapshot, laid out as::
+
+        b"MUZC" version:u8 header_size:u32
+        header     compact JSON: count, category colors, text columns, extra keys
+        colors     count * 4 doubles, NaN where a note has no color
+        favorites  count bytes, 1 for a favorite
+        revisions  count * i64, -1 where a note has none
+    """
+
+    name = format = "columnar"
+    magic = b"MUZC"
+    version = 1
+    text_fields = ("id", "title", "url", "notes", "category")
+    _columns = text_fields + ("color", "favorite", "rev")
+    _no_color = (math.nan,) * 4
+
+    def dumps(self, data):
+        notes = data.get("notes", [])
+        count = len(notes)
+        text = {field: [] for field in self.text_fields}
+        colors = array("d")
+        favorites = bytearray(count)
+        revisions = array("q")
+        extra = []
+
+        for i, note in enumerate(notes):
+            for field in self.text_fields:
+                text[field].append(note.get(field))
+            rest = {key: value for key, value in note.items() if key not in self._columns}
+            color = note.get("color")
+            if color is not None and len(color) == 4:
+                colors.extend(color)
+            else:
+                colors.extend(self._no_color)
+                if color is not None:
+                    rest["color"] = color  # Odd shape; keep it as is
+            if note.get("favorite", False):
+                favorites[i] = 1
+            revision = note.get("rev")
+            if isinstance(revision, int) and revision >= 0:
+                revisions.append(revision)
+            else:
+                revisions.append(-1)
+                if revision is not None:
+                    rest["rev"] = revision
+            extra.append(rest or None)
+
+        if sys.byteorder == "big":
+            colors.byteswap()  # Stored little-endian
+            revisions.byteswap()
+        header = dumps_json({
+            "count": count,
+            "category_colors": data.get("category_colors", {}),
+            "text": text,
+            "extra": extra,
+        }).encode("utf-8")
+        return b"".join((
+            self.magic, struct.pack("<BI", self.version, len(header)), header,
+            colors.tobytes(), bytes(favorites), revisions.tobytes(),
+        ))
+
+    def loads(self, blob):
+        view = memoryview(blob)
+        offset = len(self.magic)
+        version, header_size = struct.unpack_from("<BI", view, offset)
+        if version != self.version:
+            raise ValueError("Unsupported columnar snapshot version %d" % version)
+        offset += struct.calcsize("<BI")
+        header = loads_json(bytes(view[offset:offset + header_size]))
+        offset += header_size
+        count = header["count"]
+
+        colors = array("d")
+        colors.frombytes(view[offset:offset + count * 32])
+        offset += count * 32
+        favorites = view[offset:offset + count]
+        offset += count
+        revisions = array("q")
+        revisions.frombytes(view[offset:offset + count * 8])
+        if sys.byteorder == "big":
+            colors.byteswap()
+            revisions.byteswap()
+
+        fields = self.text_fields
+        columns = [header["text"][field] for field in fields]
+        color_tuples = zip(*[iter(colors)] * 4)  # Groups of four, no per-note list
+        notes = []
+        for values, color, favorite, revision, extra in zip(
+                zip(*columns), color_tuples, map(bool, favorites), revisions, header["extra"]):
+            note = dict(zip(fields, values))
+            if None in values:
+                note = {field: value for field, value in note.items() if value is not None}
+            if color[0] == color[0]:  # NaN marks a note without a color
+                note["color"] = color
+            note["favorite"] = favorite
+            if revision >= 0:
+                note["rev"] = revision
+            if extra:
+                note.update(extra)
+            notes.append(note)
+        return {"notes": notes, "category_colors": header["category_colors"]}
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), JsonCodec(indent=4), ColumnarCodec())}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown snapshot format %r (one of: %s)" % (name, ", ".join(CODECS)))
+
+
+def detect(blob):
+    """The codec that wrote ``blob``. Indented JSON (an object opening on a
+    line of its own) counts as json-pretty, so a store set to compact JSON
+    knows to rewrite it."""
+    if blob[:len(ColumnarCodec.magic)] == ColumnarCodec.magic:
+        return CODECS["columnar"]
+    if blob.lstrip()[:2] in (b"{\n", b"{\r"):
+        return CODECS["json-pretty"]
+    return CODECS["json"]
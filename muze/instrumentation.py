@@ -0,0 +1,117 @@
+"""Timings of the app's main operations, kept for when someone reports it got slow.
+
+A Recorder keeps the last few hundred timings in a ring buffer, plus a count
+per operation, and can export them as JSON. Switched off (the default), the
+only cost left at each call site is a flag check: ``measure`` hands back a
+shared do-nothing context manager and nothing is stored.
+
+    recorder = Recorder(enabled=True)
+    with recorder.measure("search", query_length=len(query)):
+        ...
+    recorder.export_json("perf.json")
+"""
+import json
+import statistics
+import threading
+import time
+from collections import deque
+
+from .storage import atomic_write
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "info", "start")
+
+    def __init__(self, recorder, name, info):
+        self.recorder = recorder
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, (time.perf_counter() - self.start) * 1000, **self.info)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Recorder:
+    """Ring buffer of operation timings. Safe to record from any thread."""
+
+    def __init__(self, size=500, enabled=False):
+        self.enabled = enabled
+        self.events = deque(maxlen=size)  # Oldest fall off the front
+        self.counts = {}  # Operation -> times recorded since start, including ones that fell off
+        self._lock = threading.Lock()
+
+    def measure(self, name, **info):
+        """Context manager timing the block as one ``name`` operation."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, info)
+
+    def wrap(self, name, func):
+        """``func``, timed as ``name`` whenever the recorder is on."""
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            with _Span(self, name, {}):
+                return func(*args, **kwargs)
+        return timed
+
+    def record(self, name, ms, **info):
+        """Record an operation timed elsewhere."""
+        if not self.enabled:
+            return
+        event = {"time": time.time(), "op": name, "ms": round(ms, 3)}
+        event.update(info)
+        with self._lock:
+            self.events.append(event)
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def recent(self, count):
+        """The last ``count`` events, oldest first."""
+        with self._lock:
+            return list(self.events)[-count:]
+
+    def summary(self):
+        """Per operation: how often it ran and its latencies over the buffer."""
+        with self._lock:
+            events = list(self.events)
+            counts = dict(self.counts)
+        by_op = {}
+        for event in events:
+            by_op.setdefault(event["op"], []).append(event["ms"])
+        summary = {}
+        for op, times in by_op.items():
+            times.sort()
+            summary[op] = {
+                "count": counts.get(op, len(times)),
+                "median_ms": statistics.median(times),
+                "p95_ms": times[int(len(times) * 0.95)],
+                "max_ms": times[-1],
+            }
+        return summary
+
+    def export(self):
+        with self._lock:
+            events = list(self.events)
+        return {"exported": time.time(), "summary": self.summary(), "events": events}
+
+    def export_json(self, path):
+        report = self.export()
+        atomic_write(path, lambda f: json.dump(report, f, indent=2))
@@ -0,0 +1,113 @@
+"""Search-as-you-type pipeline: debounce on the Kivy clock, match on a worker."""
+import threading
+from functools import partial
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+
+class SearchPipeline:
+    """Runs searches off the UI thread and applies only the newest result.
+
+    ``search(query, cancelled)`` is called on the worker thread and may return
+    None if it noticed it was cancelled. ``on_results(results)`` is called on
+    the main thread with the results of the last query submitted, never with
+    those of a query that has since been superseded. A search that raises is
+    logged and skipped.
+    """
+
+    def __init__(self, search, on_results, debounce=0.2):
+        self._search = search
+        self._on_results = on_results
+        self._generation = 0  # Bumped for every submitted query
+        self._query = ""
+        self._request = None  # (generation, query) waiting for the worker
+        self._chores = []  # Work for the worker while it has no query, see prepare
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._trigger = Clock.create_trigger(self._dispatch, debounce)
+        self._worker = threading.Thread(target=self._run, name="search", daemon=True)
+        self._worker.start()
+
+    @property
+    def debounce(self):
+        return self._trigger.timeout
+
+    @debounce.setter
+    def debounce(self, seconds):
+        self._trigger.timeout = seconds
+
+    def submit(self, query):
+        """Queue a query; it only runs once typing pauses for ``debounce`` seconds."""
+        self._generation += 1
+        self._query = query
+        self._trigger.cancel()  # Restart the debounce window
+        self._trigger()
+
+    def prepare(self, work):
+        """Run ``work(cancelled)`` on the worker while it has no query to run,
+        e.g. to build a search index before the first keystroke needs it.
+        ``cancelled()`` turns True when a query is waiting; work that gives
+        way by returning False is run again once the worker is free."""
+        with self._condition:
+            self._chores.append(work)
+            self._condition.notify()
+
+    def cancel(self):
+        """Drop any query in flight without applying its results."""
+        self._generation += 1
+        self._trigger.cancel()
+
+    def stop(self):
+        self.cancel()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _dispatch(self, dt):
+        with self._condition:
+            self._request = (self._generation, self._query)  # Replaces anything not started yet
+            self._condition.notify()
+
+    def _is_stale(self, generation):
+        return generation != self._generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._chores and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                chore = self._chores.pop(0) if self._request is None else None
+                if chore is None:
+                    generation, query = self._request
+                    self._request = None
+
+            if chore is not None:
+                self._run_chore(chore)  # Outside the lock, so queries can still come in
+                continue
+            if self._is_stale(generation):
+                continue
+            try:
+                results = self._search(query, lambda: self._is_stale(generation))
+            except Exception:  # Keep the worker alive for the next query
+                Logger.exception("Muze: search for %r failed" % query)
+                continue
+            if results is None or self._is_stale(generation):
+                continue
+            Clock.schedule_once(partial(self._apply, generation, results))
+
+    def _run_chore(self, work):
+        try:
+            done = work(lambda: self._stopped or self._request is not None)
+        except Exception:
+            Logger.exception("Muze: background search work failed")
+            return
+        if done is False:
+            with self._condition:
+                self._chores.insert(0, work)  # After the query that was waiting
+
+    def _apply(self, generation, results, dt):
+        if not self._is_stale(generation):
+            self._on_results(results)
@@ -0,0 +1,188 @@
+"""Fuzzy, ranked search: typo-tolerant word matching and a cache of results.
+
+A query is split into words and every word has to match some word of a note,
+exactly, as the start of a word (so results show up while typing), inside a
+word, or with a typo or two (one from 4 letters, two from 8). How good the
+match is, times the weight of the field it's in (title > category > body),
+makes the word's score; a note's score is the sum over the query's words,
+boosted for favorites. Ties keep the display order.
+
+Repositories do the matching (``NoteRepository.rank``), each with whatever
+index it has; ``RankedSearch`` sits on top and adds the cap, paging, the
+cache and narrowing a query that adds words down from the previous results.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+FIELD_WEIGHTS = {"title": 3.0, "category": 2.0, "notes": 1.0}
+FAVORITE_BOOST = 1.25  # Score multiplier for favorites
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def query_terms(query):
+    return _WORD_RE.findall(query.lower())
+
+
+def max_typos(term):
+    """Edits a query word of this length may be off by."""
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b (a swap of two
+    neighbouring letters counts as one edit), or ``limit + 1`` once it's
+    clear the distance is more than ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def word_similarity(term, word):
+    """How well a note's word matches a query word, from 0 (not at all) to 1."""
+    if word == term:
+        return 1.0
+    if word.startswith(term):
+        return 0.8
+    if len(term) >= 3 and term in word:  # Shorter fragments are inside too many words
+        return 0.5
+    typos = max_typos(term)
+    if not typos:
+        return 0.0
+    distance = edit_distance(term, word, typos)
+    if distance <= typos:
+        return 0.6 - 0.15 * (distance - 1)
+    if len(word) > len(term):
+        distance = edit_distance(term, word[:len(term)], typos)  # Mistyped while still typing
+        if distance <= typos:
+            return 0.4 - 0.15 * (distance - 1)
+    return 0.0
+
+
+def rank_texts(terms, rows, cancelled=None):
+    """Rank notes by scoring their text directly, for when there's no word
+    index to use. ``rows`` are ``(id, title, category, body, favorite)`` in
+    display order; returns the ids of matching notes, best first, or None if
+    ``cancelled()`` turned True first."""
+    similarities = {term: {} for term in terms}  # Per query word: note word -> similarity
+    scored = []
+    for position, (note_id, title, category, body, favorite) in enumerate(rows):
+        if cancelled is not None and position % 500 == 0 and cancelled():
+            return None
+        fields = (
+            (FIELD_WEIGHTS["title"], set(_WORD_RE.findall(title.lower()))),
+            (FIELD_WEIGHTS["category"], set(_WORD_RE.findall(category.lower()))),
+            (FIELD_WEIGHTS["notes"], set(_WORD_RE.findall(body.lower()))),
+        )
+        total = 0.0
+        for term in terms:
+            known = similarities[term]
+            best = 0.0
+            for weight, words in fields:
+                for word in words:
+                    similarity = known.get(word)
+                    if similarity is None:
+                        similarity = known[word] = word_similarity(term, word)
+                    if similarity * weight > best:
+                        best = similarity * weight
+            if not best:
+                break
+            total += best
+        else:
+            scored.append((-total * (FAVORITE_BOOST if favorite else 1), position, note_id))
+    scored.sort()
+    return [note_id for _, _, note_id in scored]
+
+
+class RankedSearch:
+    """Ranked search over a repository, capped, paged and cached.
+
+    Up to ``limit`` results are kept per query and handed out ``page_size``
+    at a time from the ids ``ids`` returned. The ranked ids of the last ``cache_size`` queries are kept
+    while the repository's ``revision`` stays the same; any change to a note
+    drops them all. A query that adds words after a cached one is ranked
+    among that query's results instead of the whole collection.
+
+    ``search`` is safe to call from a worker thread (see SearchPipeline).
+    """
+
+    def __init__(self, repository, limit=500, page_size=100, cache_size=32):
+        self.repository = repository
+        self.limit = limit
+        self.page_size = page_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # terms -> ranked ids, uncapped, most recently used last
+        self._revision = repository.revision
+        self._lock = threading.Lock()
+
+    def search(self, query, cancelled=None):
+        """The first page of results, or None if cancelled."""
+        ids = self.ids(query, cancelled)
+        return None if ids is None else self.page(ids, 0)
+
+    def ids(self, query, cancelled=None):
+        """Ids of a query's results, best first and up to ``limit``, or None
+        if cancelled. Pages are cut from these with ``page``, so showing more
+        ranks nothing again and can't repeat or skip a result. A query with
+        no words has none; listing every note is up to the caller, on the
+        main thread."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        ids = self.ranked_ids(terms, cancelled)
+        return None if ids is None else ids[:self.limit]
+
+    def page(self, ids, offset, count=None):
+        """The notes of ``ids[offset:offset + count]`` (a page by default)."""
+        return self.repository.get_many(ids[offset:offset + (count or self.page_size)])
+
+    def ranked_ids(self, terms, cancelled=None):
+        key = tuple(terms)
+        with self._lock:
+            if self._revision != self.repository.revision:
+                self._cache.clear()  # A note changed; any result may be stale
+                self._revision = self.repository.revision
+            revision = self._revision
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+                return ids
+            candidates = self._narrowed_from(key)
+        ids = self.repository.rank(terms, candidates, cancelled)
+        if ids is None:
+            return None
+        with self._lock:
+            if revision == self._revision:
+                self._cache[key] = ids
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return ids
+
+    def _narrowed_from(self, key):
+        """Results of a cached query that ``key`` adds words to, if there is one.
+
+        Every word has to match, so a note matching the longer query matched
+        the shorter one too. Typing on within a word doesn't narrow like
+        that: "abc" may match "xabc" as a fragment where "ab" matched nothing
+        in it, and "abcde" may match "abde" with a typo where "abcd" didn't,
+        so those are ranked from scratch.
+        """
+        for cached in reversed(self._cache):
+            if len(cached) < len(key) and key[:len(cached)] == cached:
+                return self._cache[cached]
+        return None
@@ -0,0 +1,336 @@
+"""Storage backends behind NotesApp.
+
+A repository owns the ordered list of note dicts the UI works with and keeps
+its backing store (and any search structures) in step with it. NotesApp
+never mutates ``repository.notes`` itself; it goes through ``put_note``,
+``set_favorite`` and ``delete_note``, and listens for the events they emit
+to update just what changed.
+
+Notes are keyed by their ``id`` (see ``new_note_id``); each carries a
+``rev`` that goes up every time it is saved, and the repository as a whole
+has a ``revision`` that goes up on every change to any note.
+"""
+from contextlib import contextmanager
+
+from .categories import CategoryIndex
+from .ranking import rank_texts
+from .search import SearchIndex
+from .storage import JournalStore
+
+PREVIEW_LENGTH = 50  # Characters of the body shown on a card
+
+# Events passed to listeners as ``listener(event, note)``
+NOTE_ADDED = "added"
+NOTE_UPDATED = "updated"
+NOTE_REMOVED = "removed"
+NOTE_FAVORITE_CHANGED = "favorite-changed"
+NOTES_CHANGED = "changed"  # After a batch; the note is None, reload whatever is shown
+
+
+def prepare_note(note):
+    """Turn a stored note into the in-memory form (colors are tuples)."""
+    if note.get("color") is not None:
+        note["color"] = tuple(note["color"])
+    return note
+
+
+def note_preview(note):
+    """Card preview text, from the body or from the preview of a header."""
+    if "notes" not in note and "preview" in note:
+        return note["preview"] + "..."
+    return note.get("notes", "No content available")[:PREVIEW_LENGTH] + "..."  # Get the first 50 characters or fallback message
+
+
+class NoteRepository:
+    """Base class: in-memory bookkeeping shared by every backend.
+
+    Subclasses implement ``_load``, ``_write_note``, ``_remove_note`` and
+    ``_write_category_color``, and may override the queries with something
+    faster than the defaults here.
+
+    Backends that can load lazily hand out *headers* first: note dicts
+    without ``notes`` and ``url`` but with a short ``preview``. Call
+    ``load_body`` before anything needs the full note.
+    """
+
+    fully_loaded = True  # False while load_more still has notes to hand out
+
+    def __init__(self):
+        self.category_colors = {}
+        self.categories = CategoryIndex()
+        self.revision = 0  # Bumped on every change to a note
+        self._by_id = {}  # id -> note, every note handed out so far
+        self._listed = {}  # id -> note, in display order (dicts keep insertion order)
+        self._notes = []  # The notes property; None until rebuilt after a delete
+        self._listeners = []
+        self._watchers = []
+        self._batch_depth = 0
+        self._batch_changed = False
+
+    @property
+    def notes(self):
+        """Ordered note dicts, shared with the UI.
+
+        Deletes only drop the note from the id index; the list is rebuilt the
+        next time it's asked for, so fetch it again after a change instead of
+        holding on to it.
+        """
+        if self._notes is None:
+            self._notes = list(self._ordered())
+        return self._notes
+
+    def _ordered(self):
+        return self._listed.values()
+
+    def bind(self, listener):
+        """Call ``listener(event, note)`` after every change to a note."""
+        self._listeners.append(listener)
+
+    def unbind(self, listener):
+        self._listeners.remove(listener)
+
+    def watch(self, watcher):
+        """Call ``watcher(event, note)`` for every change to a note, batched or
+        not. For bookkeeping that must see each note (sync); the UI binds."""
+        self._watchers.append(watcher)
+
+    def unwatch(self, watcher):
+        self._watchers.remove(watcher)
+
+    def _emit(self, event, note):
+        for watcher in self._watchers:
+            watcher(event, note)
+        if self._batch_depth:
+            self._batch_changed = True  # Reported once by end_batch
+            return
+        self._notify(event, note)
+
+    def _notify(self, event, note):
+        for listener in list(self._listeners):
+            listener(event, note)
+
+    def begin_batch(self):
+        """Start a batch of changes: listeners get a single NOTES_CHANGED
+        when it ends instead of an event per note, and backends that can
+        write the whole batch at once do. Batches nest."""
+        self._batch_depth += 1
+        if self._batch_depth == 1:
+            self._batch_changed = False
+            self._begin_writes()
+
+    def end_batch(self):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        self._end_writes()
+        self.flush()
+        if self._batch_changed:
+            self._notify(NOTES_CHANGED, None)  # Watchers saw each change already
+
+    @contextmanager
+    def batch(self):
+        self.begin_batch()
+        try:
+            yield self
+        finally:
+            self.end_batch()
+
+    def _begin_writes(self):
+        pass
+
+    def _end_writes(self):
+        pass
+
+    def load(self, limit=None):
+        """Load the notes and category colors; returns ``(notes, category_colors)``.
+
+        A lazy backend returns only the first ``limit`` notes (as headers),
+        and the rest come from ``load_more``. Others always load everything.
+        """
+        notes, category_colors = self._load()
+        self._listed = {note["id"]: prepare_note(note) for note in notes}
+        self._by_id = dict(self._listed)
+        self._notes = None
+        self.category_colors = {category: tuple(color) for category, color in category_colors.items()}
+        self.categories.rebuild(self.notes, self.category_colors)
+        return self.notes, self.category_colors
+
+    def needs_import(self):
+        """Whether ``load`` would first import notes from another store, which
+        can take a while; ``run_import`` does just that part, on any thread."""
+        return False
+
+    def run_import(self, report=None, cancelled=None):
+        """Import what ``needs_import`` said ``load`` would; returns how many
+        notes, or None if ``cancelled()`` turned True first."""
+        return 0
+
+    def load_more(self, limit):
+        """Load up to ``limit`` more notes after a lazy ``load``.
+
+        Returns ``(index, notes)``: the notes were inserted into
+        ``self.notes`` at ``index``.
+        """
+        return len(self.notes), []
+
+    def load_body(self, note):
+        """Fill in the body and URL of a note that was loaded as a header."""
+
+    def unload_body(self, note):
+        """Turn a note back into a header, if the backend can reload its body."""
+
+    def get(self, note_id):
+        return self._by_id.get(note_id)
+
+    def get_many(self, note_ids):
+        """The notes for ids, in the same order, skipping any that are gone."""
+        return [self._by_id[note_id] for note_id in note_ids if note_id in self._by_id]
+
+    def count(self):
+        """How many notes there are, loaded or not."""
+        return len(self._listed)
+
+    def revisions(self):
+        """Every note's ``rev`` by id, loaded or not."""
+        return {note_id: note.get("rev", 0) for note_id, note in self._by_id.items()}
+
+    def put_note(self, note, event=NOTE_UPDATED):
+        """Save a new or edited note, bumping its revision."""
+        note["rev"] = note.get("rev", 0) + 1  # Lets caches tell this version from the last
+        self.revision += 1
+        if note["id"] not in self._by_id:
+            self._by_id[note["id"]] = note
+            self._list(note)
+            event = NOTE_ADDED
+        self.categories.put(note)
+        self._write_note(note)
+        self._emit(event, note)
+
+    def set_favorite(self, note, favorite):
+        note["favorite"] = favorite
+        self.put_note(note, event=NOTE_FAVORITE_CHANGED)
+
+    def set_category(self, note, category):
+        """Move a note to a category, giving it the category's color."""
+        note["category"] = category
+        note["color"] = self.category_colors[category]
+        self.put_note(note)
+
+    def export_notes(self):
+        """Every note with its body, in display order, for an export. Call it
+        on the main thread; the result can be iterated on any thread."""
+        return [dict(note) for note in self.notes]
+
+    def delete_note(self, note):
+        if self._by_id.pop(note["id"], None) is None:
+            return
+        self.revision += 1
+        self._unlist(note)
+        self.categories.remove(note)
+        self._remove_note(note)
+        self._emit(NOTE_REMOVED, note)
+
+    def _list(self, note):
+        """Add a new note at the end of the display order."""
+        self._listed[note["id"]] = note
+        if self._notes is not None:
+            self._notes.append(note)
+
+    def _unlist(self, note):
+        if self._listed.pop(note["id"], None) is not None:
+            self._notes = None
+
+    def set_category_color(self, category, color):
+        self.category_colors[category] = color
+        self.categories.add_name(category)
+        self._write_category_color(category, color)
+
+    def search(self, query, cancelled=None):
+        """Notes matching every word of the query (see SearchIndex), or None
+        if ``cancelled()`` turned True before the search finished."""
+        raise NotImplementedError
+
+    def prepare_search(self, cancelled=None):
+        """Build whatever the first search would otherwise have to, so it
+        doesn't wait for it; meant for a worker thread after ``load``.
+        Returns False if ``cancelled()`` turned True first."""
+        return True
+
+    def rank(self, terms, candidates=None, cancelled=None):
+        """Ids of the notes matching every query word fuzzily, best first, or
+        None if ``cancelled()`` turned True (see muze.ranking). Given
+        ``candidates`` (ids), only those notes are looked at."""
+        return rank_texts(terms, self._rank_rows(candidates), cancelled)
+
+    def _rank_rows(self, candidates):
+        """``(id, title, category, body, favorite)`` per note, in display order."""
+        notes = self.notes
+        if candidates is not None:
+            wanted = set(candidates)
+            notes = [note for note in notes if note["id"] in wanted]
+        return [(note["id"], note.get("title", ""), note.get("category", ""), note.get("notes", ""),
+                 note.get("favorite", False)) for note in notes]
+
+    def favorites(self):
+        return [note for note in self.notes if note.get("favorite", False)]
+
+    def in_category(self, category):
+        """Notes in one category, in display order."""
+        return self.categories.notes(category)
+
+    def flush(self):
+        """Make sure everything saved so far is on disk."""
+
+    def close(self):
+        self.flush()
+
+
+class JsonNoteRepository(NoteRepository):
+    """notes.json snapshot + change log, searched with the in-memory index."""
+
+    def __init__(self, path, codec="json"):
+        super().__init__()
+        self.store = JournalStore(path, lambda: (self.notes, self.category_colors), codec)
+        self.search_index = SearchIndex()
+
+    def _load(self):
+        return self.store.load()
+
+    def load(self, limit=None):
+        notes, category_colors = super().load()
+        if self.store.needs_compaction:
+            self.store.compact()  # New file, or ids were just given to old notes
+        self.search_index.rebuild(notes)
+        return notes, category_colors
+
+    def put_note(self, note, event=NOTE_UPDATED):
+        self.search_index.add(note)  # Updates it if it's already indexed
+        super().put_note(note, event)
+
+    def delete_note(self, note):
+        self.search_index.remove(note)
+        super().delete_note(note)
+
+    def _write_note(self, note):
+        self.store.put_note(note)
+
+    def _remove_note(self, note):
+        self.store.delete_note(note["id"])
+
+    def _write_category_color(self, category, color):
+        self.store.set_category_color(category, color)
+
+    def search(self, query, cancelled=None):
+        return self.search_index.search(query, cancelled)
+
+    def prepare_search(self, cancelled=None):
+        return self.search_index.index_pending(cancelled)
+
+    def rank(self, terms, candidates=None, cancelled=None):
+        return self.search_index.rank(terms, candidates, cancelled)
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,362 @@
+"""In-memory full-text index over the notes' title, category and body."""
+import re
+import threading
+from collections import Counter
+from itertools import islice
+
+from .ranking import FAVORITE_BOOST, FIELD_WEIGHTS, max_typos, word_similarity
+
+_TOKEN_RE = re.compile(r"\w+")
+_FIELD_SEP = "\x1f"  # Keeps a query from matching across two fields
+_INDEX_BATCH = 500  # Notes indexed per lock hold while catching up
+
+
+def normalize(note):
+    """Lowercased searchable text of a note, computed once per edit."""
+    return _FIELD_SEP.join((
+        note.get("title", ""),
+        note.get("category", ""),
+        note.get("notes", ""),
+    )).lower()
+
+
+def ngrams(word):
+    """All 1-, 2- and 3-character substrings of a word."""
+    return {word[i:i + n] for n in (1, 2, 3) for i in range(len(word) - n + 1)}
+
+
+class Vocabulary:
+    """A set of words indexed by their 1/2/3-grams, to find the words
+    containing a fragment, or close to a mistyped word, without looking at
+    every word."""
+
+    def __init__(self):
+        self.words = set()
+        self._grams = {}  # n-gram -> set of words containing it
+
+    def add(self, word):
+        if word not in self.words:
+            self.words.add(word)
+            for gram in ngrams(word):
+                self._grams.setdefault(gram, set()).add(word)
+
+    def discard(self, word):
+        if word in self.words:
+            self.words.discard(word)
+            for gram in ngrams(word):
+                words = self._grams[gram]
+                words.discard(word)
+                if not words:
+                    del self._grams[gram]
+
+    def update(self, words, cancelled=None):
+        """Make the vocabulary exactly ``words`` (a set), touching only the
+        difference. Returns False if ``cancelled()`` turned True first; what's
+        done so far stays, and the next update finishes it."""
+        for i, word in enumerate(self.words - words):
+            if cancelled is not None and i % 1000 == 0 and cancelled():
+                return False
+            self.discard(word)
+        for i, word in enumerate(words - self.words):
+            if cancelled is not None and i % 1000 == 0 and cancelled():
+                return False
+            self.add(word)
+        return True
+
+    def containing(self, fragment):
+        if len(fragment) <= 3:
+            return self._grams.get(fragment, set())
+        grams = sorted({fragment[i:i + 3] for i in range(len(fragment) - 2)},
+                       key=lambda gram: len(self._grams.get(gram, ())))  # Rarest first
+        words = set(self._grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not words:
+                break
+            words &= self._grams.get(gram, set())
+        return {word for word in words if fragment in word}
+
+    def matching(self, term, cancelled=None):
+        """Words matching a query word, fuzzily: ``{word: similarity}``, or
+        None if ``cancelled()`` turned True first."""
+        found = {}
+        for i, word in enumerate(self.containing(term)):
+            if cancelled is not None and i % 1000 == 0 and cancelled():
+                return None
+            similarity = word_similarity(term, word)
+            if similarity:
+                found[word] = similarity
+        typos = max_typos(term)
+        if typos:
+            # Each typo breaks at most three of the term's bigrams (a swap), so a close
+            # word shares all but 3 * typos of them
+            bigrams = {term[i:i + 2] for i in range(len(term) - 1)}
+            shared = Counter()
+            for gram in bigrams:
+                shared.update(self._grams.get(gram, ()))
+            needed = len(bigrams) - 3 * typos
+            for i, (word, count) in enumerate(shared.items()):
+                if cancelled is not None and i % 1000 == 0 and cancelled():
+                    return None
+                if count >= needed and word not in found:
+                    similarity = word_similarity(term, word)
+                    if similarity:
+                        found[word] = similarity
+        return found
+
+
+class SearchIndex:
+    """Word index over notes, updated incrementally as notes change.
+
+    Every note keeps its normalized text and its set of words. Words map to
+    the notes containing them, and the vocabulary itself is indexed by
+    1/2/3-grams so a query fragment finds the words containing it without
+    looking at any note.
+
+    Queries are split on whitespace and every term has to match (AND).
+    A plain term matches anywhere in the title, category or body, like the old
+    substring search; a term ending in ``*`` matches words starting with it.
+    Results come back in the order the notes were added.
+
+    ``rank`` is the fuzzy, ranked alternative to ``search``; it matches
+    query words against the vocabulary first, so a typo costs a lookup of
+    similar words rather than a pass over the notes.
+
+    Indexing is deferred, so loading a big collection doesn't pay for it up
+    front: ``index_pending`` catches up in the background, and a search
+    catches up on whatever is still left.
+
+    The index is safe to search from a worker thread while the UI thread keeps
+    adding and updating notes; catching up on deferred indexing is done in
+    small batches so writers never wait long for the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}  # key -> note, in insertion order
+        self._seq = {}  # key -> insertion counter, for ordering small results
+        self._next_seq = 0
+        self._pending = {}  # key -> note, added but not indexed yet
+        self._texts = {}  # key -> normalized text
+        self._words = {}  # key -> set of words in the note
+        self._field_words = {}  # key -> (title words, category words), for ranking
+        self._word_docs = {}  # word -> set of keys
+        self._vocabulary = Vocabulary()
+
+    @staticmethod
+    def key(note):
+        return note["id"]
+
+    def __len__(self):
+        return len(self._docs)
+
+    def rebuild(self, notes):
+        with self._lock:
+            self.__init__()
+            for note in notes:
+                self.add(note)
+
+    def add(self, note):
+        key = self.key(note)
+        with self._lock:
+            if key in self._docs:
+                self.update(note)
+                return
+            self._docs[key] = note
+            self._seq[key] = self._next_seq
+            self._next_seq += 1
+            self._pending[key] = note
+
+    def update(self, note):
+        """Re-index a note after its text changed. Keeps its position."""
+        key = self.key(note)
+        text = normalize(note)
+        with self._lock:
+            if key not in self._docs:
+                self.add(note)
+                return
+            if key in self._pending:
+                return  # Will be indexed from its current text anyway
+            if text == self._texts[key]:
+                return  # Nothing searchable changed (e.g. only the favorite flag)
+            self._unindex(key)
+            self._index(key, text)
+
+    def remove(self, note):
+        key = self.key(note)
+        with self._lock:
+            if self._docs.pop(key, None) is not None:
+                del self._seq[key]
+                if self._pending.pop(key, None) is None:
+                    self._unindex(key)
+
+    def index_pending(self, cancelled=None):
+        """Index deferred notes in batches. Returns False if cancelled first."""
+        while self._pending:
+            if cancelled is not None and cancelled():
+                return False
+            with self._lock:
+                self._index_batch(_INDEX_BATCH)
+        return True
+
+    def _index_batch(self, limit):
+        for key, note in list(islice(self._pending.items(), limit)):
+            self._index(key, normalize(note))
+            del self._pending[key]
+
+    def _index(self, key, text):
+        words = set(_TOKEN_RE.findall(text))
+        title, category, _ = text.split(_FIELD_SEP, 2)
+        self._texts[key] = text
+        self._words[key] = words
+        self._field_words[key] = (set(_TOKEN_RE.findall(title)), set(_TOKEN_RE.findall(category)))
+        for word in words:
+            keys = self._word_docs.get(word)
+            if keys is None:
+                self._word_docs[word] = {key}
+                self._vocabulary.add(word)
+            else:
+                keys.add(key)
+
+    def _unindex(self, key):
+        del self._texts[key]
+        del self._field_words[key]
+        for word in self._words.pop(key):
+            keys = self._word_docs[word]
+            keys.discard(key)
+            if not keys:
+                del self._word_docs[word]
+                self._vocabulary.discard(word)
+
+    def _words_containing(self, fragment):
+        return self._vocabulary.containing(fragment)
+
+    def _postings_size(self, words):
+        """Total postings behind a word set, capped just past the doc count."""
+        limit = len(self._docs)
+        size = 0
+        for word in words:
+            size += len(self._word_docs[word])
+            if size > limit:
+                break
+        return size
+
+    def _plan(self, term):
+        """Work out how to match one query term.
+
+        Returns ``(word_sets, check, prefix, term)``: a matching note contains a
+        word from each of ``word_sets``, and ``check`` (if not None) must also
+        be a substring of its normalized text.
+        """
+        if term.endswith("*") and len(term) > 1:
+            prefix = term[:-1]
+            if _TOKEN_RE.fullmatch(prefix):
+                words = {word for word in self._words_containing(prefix) if word.startswith(prefix)}
+                return [words], None, True, term
+            term = prefix  # Punctuation in a prefix; fall back to substring
+
+        parts = _TOKEN_RE.findall(term)
+        # A term that's a single run of word characters is fully answered by
+        # the words; anything with punctuation gets confirmed on the text
+        check = None if parts == [term] else term
+        return [self._words_containing(part) for part in parts], check, False, term
+
+    def search(self, query, cancelled=None):
+        """Return the notes matching every term of the query.
+
+        ``cancelled`` is an optional callable polled while catching up on
+        indexing; if it returns True the search gives up and returns None.
+        """
+        terms = query.lower().split()
+        if not terms:
+            with self._lock:
+                return list(self._docs.values())
+        if not self.index_pending(cancelled):
+            return None
+        with self._lock:
+            self._index_batch(len(self._pending))  # Anything added meanwhile
+            return self._search(terms)
+
+    def _search(self, terms):
+        plans = [self._plan(term) for term in terms]
+        word_sets = [words for plan in plans for words in plan[0]]
+        if any(not words for words in word_sets):
+            return []
+        sizes = {id(words): self._postings_size(words) for words in word_sets}
+        seed = min(word_sets, key=lambda words: sizes[id(words)], default=None)
+
+        if seed is None or (sizes[id(seed)] > len(self._docs)
+                            and not any(plan[2] for plan in plans)):
+            # Even the most selective word set is everywhere (e.g. a single
+            # letter): one pass over the precomputed texts beats merging postings
+            texts = self._texts
+            keys = self._docs
+            for plan in plans:
+                needle = plan[3]
+                keys = [key for key in keys if needle in texts[key]]
+            return [self._docs[key] for key in keys]
+
+        # Seed from the cheapest word set, then filter per note
+        result = set()
+        for word in seed:
+            result.update(self._word_docs[word])
+        for words in word_sets:
+            if words is not seed:
+                result = {key for key in result if not self._words[key].isdisjoint(words)}
+        for _, check, _, _ in plans:
+            if check is not None:
+                result = {key for key in result if check in self._texts[key]}
+        return self._in_order(result)
+
+    def _in_order(self, result):
+        if len(result) * 8 > len(self._docs):
+            # Big result: walking the ordered docs is cheaper than sorting
+            return [note for key, note in self._docs.items() if key in result]
+        return [self._docs[key] for key in sorted(result, key=self._seq.__getitem__)]
+
+    def rank(self, terms, candidates=None, cancelled=None):
+        """Keys of the notes matching every term fuzzily, best first (see
+        muze.ranking), or None if cancelled while catching up on indexing.
+        Only ``candidates`` are looked at when given."""
+        if not self.index_pending(cancelled):
+            return None
+        with self._lock:
+            self._index_batch(len(self._pending))
+            matched = [self._vocabulary.matching(term) for term in terms]
+            if not all(matched):
+                return []
+            if candidates is None:
+                # Start from the term whose matching words are in the fewest notes
+                seed = min(matched, key=self._postings_size)
+                keys = set()
+                for word in seed:
+                    keys.update(self._word_docs[word])
+            else:
+                keys = [key for key in candidates if key in self._docs]
+
+            title_weight, category_weight, body_weight = (
+                FIELD_WEIGHTS["title"], FIELD_WEIGHTS["category"], FIELD_WEIGHTS["notes"])
+            matched = [(similarities, set(similarities)) for similarities in matched]
+            scored = []
+            for key in keys:
+                words = self._words[key]
+                title_words, category_words = self._field_words[key]
+                total = 0.0
+                for similarities, matching_words in matched:
+                    best = 0.0
+                    for word in words & matching_words:
+                        if word in title_words:
+                            weight = title_weight
+                        elif word in category_words:
+                            weight = category_weight
+                        else:
+                            weight = body_weight
+                        best = max(best, similarities[word] * weight)
+                    if not best:
+                        break
+                    total += best
+                else:
+                    if self._docs[key].get("favorite", False):
+                        total *= FAVORITE_BOOST
+                    scored.append((-total, self._seq[key], key))
+            scored.sort()
+            return [key for _, _, key in scored]
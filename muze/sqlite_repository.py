@@ -0,0 +1,659 @@
+"""SQLite backend: indexed favorites/category queries and FTS5 search."""
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
+
+from .ranking import FAVORITE_BOOST, FIELD_WEIGHTS
+from .repository import PREVIEW_LENGTH, NoteRepository
+from .search import Vocabulary
+from .storage import JournalStore
+
+_COLUMNS = ("id", "title", "url", "notes", "category", "color", "favorite")
+_NOT_STORED = ("preview",)  # Derived keys of a header, never saved
+SCHEMA_VERSION = 1  # PRAGMA user_version; see _migrate
+COMPRESS_MIN_LENGTH = 2048  # Bodies at least this long are stored zlib-compressed
+RANK_SCAN_LIMIT = 200  # Up to this many candidates are ranked from their text, not the word index
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,  -- Display order
+    title TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',  -- Or a zlib-compressed BLOB when long; read it with muze_text
+    preview TEXT NOT NULL DEFAULT '',  -- Start of the body, so headers never read the body
+    category TEXT NOT NULL DEFAULT '',
+    color TEXT,  -- JSON list
+    favorite INTEGER NOT NULL DEFAULT 0,
+    extra TEXT  -- JSON object with any other keys of the note
+);
+CREATE INDEX IF NOT EXISTS notes_position ON notes (position);
+CREATE INDEX IF NOT EXISTS notes_favorite ON notes (favorite, position);
+CREATE INDEX IF NOT EXISTS notes_category ON notes (category, position);
+CREATE TABLE IF NOT EXISTS category_colors (
+    category TEXT PRIMARY KEY,
+    color TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Trigram tokenizer (SQLite 3.34+) so MATCH does substring search like the
+# rest of the app; external content keeps the text stored only once. The
+# triggers index the decompressed body.
+_FTS_TRIGGERS = ("notes_fts_insert", "notes_fts_delete", "notes_fts_update")
+_WORDS_TRIGGERS = ("notes_words_insert", "notes_words_delete", "notes_words_update")
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5 (
+    title, category, body,
+    content='notes', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts (rowid, title, category, body)
+    VALUES (new.rowid, new.title, new.category, muze_text(new.body));
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, muze_text(old.body));
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF title, category, body ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, muze_text(old.body));
+    INSERT INTO notes_fts (rowid, title, category, body)
+    VALUES (new.rowid, new.title, new.category, muze_text(new.body));
+END;
+"""
+
+# Word index for ranked search: real words (the trigram index has none), and
+# through fts5vocab the vocabulary and which column of which note has a word
+_WORDS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_words USING fts5 (
+    title, category, body,
+    content='notes', content_rowid='rowid', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_words_row USING fts5vocab (notes_words, 'row');
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_words_instance USING fts5vocab (notes_words, 'instance');
+CREATE TRIGGER IF NOT EXISTS notes_words_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_words (rowid, title, category, body)
+    VALUES (new.rowid, new.title, new.category, muze_text(new.body));
+END;
+CREATE TRIGGER IF NOT EXISTS notes_words_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_words (notes_words, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, muze_text(old.body));
+END;
+CREATE TRIGGER IF NOT EXISTS notes_words_update AFTER UPDATE OF title, category, body ON notes BEGIN
+    INSERT INTO notes_words (notes_words, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, muze_text(old.body));
+    INSERT INTO notes_words (rowid, title, category, body)
+    VALUES (new.rowid, new.title, new.category, muze_text(new.body));
+END;
+"""
+_COLUMN_WEIGHTS = {"title": FIELD_WEIGHTS["title"], "category": FIELD_WEIGHTS["category"],
+                   "body": FIELD_WEIGHTS["notes"]}
+
+_UPSERT = """
+INSERT INTO notes (id, position, title, url, body, preview, category, color, favorite, extra)
+VALUES (?, COALESCE((SELECT MAX(position) FROM notes), 0) + 1, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    title = excluded.title, url = excluded.url, body = excluded.body, preview = excluded.preview,
+    category = excluded.category, color = excluded.color,
+    favorite = excluded.favorite, extra = excluded.extra
+"""
+
+_UPDATE_HEADER = """
+UPDATE notes SET title = ?, category = ?, color = ?, favorite = ?, extra = ?
+WHERE id = ?
+"""
+
+_FULL_COLUMNS = "id, title, url, body, category, color, favorite, extra"
+_HEADER_COLUMNS = "id, title, category, color, favorite, extra, preview"
+
+_SEARCH_TEXT = "n.title || char(31) || n.category || char(31) || muze_text(n.body)"
+
+
+def _pack_body(body):
+    """Long bodies go in compressed (as a BLOB), if that makes them smaller."""
+    if len(body) < COMPRESS_MIN_LENGTH:
+        return body
+    packed = zlib.compress(body.encode("utf-8"), 6)
+    return packed if len(packed) < len(body) else body
+
+
+def _unpack_body(body):
+    if isinstance(body, bytes):
+        return zlib.decompress(body).decode("utf-8")
+    return body
+
+
+@lru_cache(maxsize=64)
+def _word_prefix_pattern(prefix):
+    return re.compile(r"(?<!\w)" + re.escape(prefix))
+
+
+def _has_word_prefix(text, prefix):
+    return _word_prefix_pattern(prefix).search(text.lower()) is not None
+
+
+def _note_row(note):
+    extra = {key: value for key, value in note.items() if key not in _COLUMNS and key not in _NOT_STORED}
+    color = note.get("color")
+    body = note.get("notes", "")
+    return (
+        note["id"],
+        note.get("title", ""),
+        note.get("url", ""),
+        _pack_body(body),
+        body[:PREVIEW_LENGTH],
+        note.get("category", ""),
+        json.dumps(list(color)) if color is not None else None,
+        1 if note.get("favorite", False) else 0,
+        json.dumps(extra) if extra else None,
+    )
+
+
+def _row_note(row):
+    """Note dict from a row of _FULL_COLUMNS."""
+    note_id, title, url, body, category, color, favorite, extra = row
+    note = {"id": note_id, "title": title, "url": url, "notes": _unpack_body(body), "category": category}
+    return _finish_note(note, color, favorite, extra)
+
+
+def _header_note(row):
+    """Header dict (no body, a short preview instead) from a row of _HEADER_COLUMNS."""
+    note_id, title, category, color, favorite, extra, preview = row
+    note = {"id": note_id, "title": title, "category": category, "preview": preview}
+    return _finish_note(note, color, favorite, extra)
+
+
+def _finish_note(note, color, favorite, extra):
+    if color is not None:
+        note["color"] = tuple(json.loads(color))
+    note["favorite"] = bool(favorite)
+    if extra:
+        note.update(json.loads(extra))
+    return note
+
+
+def _connect(path):
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    db.create_function("muze_word_prefix", 2, _has_word_prefix, deterministic=True)
+    db.create_function("muze_text", 1, _unpack_body, deterministic=True)
+    db.create_function("muze_pack", 1, _pack_body, deterministic=True)
+    return db
+
+
+class SqliteNoteRepository(NoteRepository):
+    """Notes in a SQLite database.
+
+    On first use, an existing ``notes.json`` (snapshot and change log) is
+    imported once. Search runs on an FTS5 trigram index when the SQLite build
+    has one, and falls back to a table scan otherwise. Searches read through
+    a connection of their own, so a search on the worker thread never holds
+    up the main thread's reads and writes; they see what's committed.
+
+    Loading can be lazy: ``load(limit)`` reads just the first headers, and
+    ``load_more`` streams the rest in by position. Notes found by a search or
+    a favorites query before the stream reached them get their header read on
+    the spot and are then reused (same dict) when the stream gets there.
+
+    Bodies of at least ``COMPRESS_MIN_LENGTH`` characters are stored
+    zlib-compressed. Headers carry a stored preview, so only ``load_body``
+    ever reads (and decompresses) a body, and ``unload_body`` lets it go
+    again once the note is closed.
+    """
+
+    def __init__(self, path, import_from=None):
+        super().__init__()
+        self._streamed = {}  # id -> note, streamed in by position; notes added since follow
+        self.path = path
+        self.import_from = import_from
+        self._lock = threading.RLock()  # Guards the main connection, which any thread may use
+        self._db = _connect(path)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")  # Durable at checkpoints, never corrupt
+        self._migrate()
+        self._db.executescript(_SCHEMA)
+        try:
+            self._db.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False  # No FTS5 or no trigram tokenizer in this build
+        self.has_words = self._create_word_index()
+        self._vocabulary = Vocabulary()  # Words of the notes_words index, for fuzzy matching
+        self._vocabulary_revision = None  # repository revision the vocabulary was read at
+        if path == ":memory:":
+            self._reader, self._reader_lock = self._db, self._lock  # Nothing else can see this one
+        else:
+            # The search thread's own connection: with WAL it reads the last
+            # commit while the main thread writes, so neither waits for the other
+            self._reader = _connect(path)
+            self._reader.execute("PRAGMA query_only = ON")
+            self._reader_lock = threading.Lock()
+
+    def _create_word_index(self):
+        """Create the ranked search word index, filling it in if the database
+        already has notes. Returns False if this SQLite has no FTS5."""
+        exists = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_words'").fetchone()
+        try:
+            self._db.executescript(_WORDS_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            self._db.execute("BEGIN")
+            self._db.execute("INSERT INTO notes_words (rowid, title, category, body) "
+                             "SELECT rowid, title, category, muze_text(body) FROM notes")
+            self._db.execute("COMMIT")
+        return True
+
+    def _migrate(self):
+        """Bring a database written by an older version up to SCHEMA_VERSION."""
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        exists = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes'").fetchone()
+        if exists and version < 1:
+            # 1: stored previews, compressed long bodies, FTS triggers that decompress
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("ALTER TABLE notes ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+                self._db.execute("UPDATE notes SET preview = substr(body, 1, ?)", (PREVIEW_LENGTH,))
+                for trigger in _FTS_TRIGGERS:
+                    self._db.execute("DROP TRIGGER IF EXISTS %s" % trigger)
+                # No triggers now, and the FTS index keeps the same text
+                self._db.execute("UPDATE notes SET body = muze_pack(body) WHERE length(body) >= ?",
+                                 (COMPRESS_MIN_LENGTH,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self._db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def needs_import(self):
+        with self._lock:
+            return bool(self.import_from and os.path.exists(self.import_from) and not self._meta("imported_from"))
+
+    def run_import(self, report=None, cancelled=None):
+        """Import ``import_from`` (see ``import_json``). Tried once per
+        session: an import that failed or was cancelled is tried again the
+        next time the database is opened."""
+        path, self.import_from = self.import_from, None
+        return self.import_json(path, report, cancelled) if path else 0
+
+    def _load(self):
+        with self._lock:
+            if self.needs_import():
+                self.run_import()
+            notes = [_row_note(row) for row in self._db.execute(
+                "SELECT %s FROM notes ORDER BY position" % _FULL_COLUMNS)]
+            category_colors = {category: json.loads(color) for category, color in
+                               self._db.execute("SELECT category, color FROM category_colors")}
+        return notes, category_colors
+
+    def load(self, limit=None):
+        if limit is None:
+            self.fully_loaded = True
+            self._streamed = {}
+            return super().load()
+
+        with self._lock:
+            if self.needs_import():
+                self.run_import()
+            # Notes added from now on land after everything the stream covers
+            self._stream_end = self._db.execute("SELECT COALESCE(MAX(position), 0) FROM notes").fetchone()[0]
+            self._stream_position = 0  # Position of the last streamed note
+            self._streamed = {}
+            self._listed = {}
+            self._notes = []
+            self._by_id = {}
+            self.fully_loaded = False
+            self.category_colors = {category: tuple(json.loads(color)) for category, color in
+                                    self._db.execute("SELECT category, color FROM category_colors")}
+            # Counted here, since most notes won't be loaded for a while
+            counts = dict(self._db.execute("SELECT category, COUNT(*) FROM notes GROUP BY category"))
+            self.categories.rebuild((), self.category_colors, counts)
+            self.load_more(limit)
+        return self.notes, self.category_colors
+
+    def load_more(self, limit):
+        if self.fully_loaded:
+            return len(self.notes), []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT position, %s FROM notes WHERE position > ? AND position <= ? "
+                "ORDER BY position LIMIT ?" % _HEADER_COLUMNS,
+                (self._stream_position, self._stream_end, limit)).fetchall()
+            if len(rows) < limit:
+                self.fully_loaded = True
+            if rows:
+                self._stream_position = rows[-1][0]
+            batch = [self._by_id.get(row[1]) or self._track(_header_note(row[1:])) for row in rows]
+            index = len(self._streamed)
+            for note in batch:
+                self._streamed[note["id"]] = note
+            if self._notes is not None:
+                self._notes[index:index] = batch  # Ahead of notes added since loading
+        return index, batch
+
+    def _ordered(self):
+        return chain(self._streamed.values(), self._listed.values())
+
+    def _track(self, note):
+        self._by_id[note["id"]] = note
+        self.categories.track(note)
+        return note
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def revisions(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, extra FROM notes").fetchall()
+        return {note_id: json.loads(extra).get("rev", 0) if extra else 0 for note_id, extra in rows}
+
+    def get(self, note_id):
+        found = self._notes_for([note_id])  # Reads the header if it isn't loaded yet
+        return found[0] if found else None
+
+    def get_many(self, note_ids):
+        return self._notes_for(note_ids)
+
+    def export_notes(self):
+        with self._lock:
+            end = self._db.execute("SELECT COALESCE(MAX(position), 0) FROM notes").fetchone()[0]
+        return self._export(end)
+
+    def _export(self, end, chunk=500):
+        position = 0
+        while True:
+            with self._lock:  # Per chunk, so the UI thread gets its turns
+                rows = self._db.execute(
+                    "SELECT position, %s FROM notes WHERE position > ? AND position <= ? "
+                    "ORDER BY position LIMIT ?" % _FULL_COLUMNS, (position, end, chunk)).fetchall()
+            if not rows:
+                return
+            position = rows[-1][0]
+            for row in rows:
+                yield _row_note(row[1:])
+
+    def _begin_writes(self):
+        with self._lock:
+            self._db.execute("BEGIN")
+
+    def _end_writes(self):
+        with self._lock:
+            self._db.execute("COMMIT")
+            self.revision += 1  # The search connection sees the batch only now
+
+    def flush(self):
+        if self._batch_depth:
+            with self._lock:  # Commit what a long batch has so far
+                self._db.execute("COMMIT")
+                self._db.execute("BEGIN")
+                self.revision += 1
+
+    def load_body(self, note):
+        if "notes" in note:
+            return
+        with self._lock:
+            row = self._db.execute("SELECT url, body FROM notes WHERE id = ?", (note["id"],)).fetchone()
+        if row is not None:
+            note["url"], note["notes"] = row[0], _unpack_body(row[1])
+            note.pop("preview", None)
+
+    def unload_body(self, note):
+        if "notes" in note and note["id"] in self._by_id:
+            note["preview"] = note["notes"][:PREVIEW_LENGTH]
+            del note["notes"]
+            note.pop("url", None)
+
+    def _meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_json(self, path, report=None, cancelled=None, chunk=500):
+        """One-shot import of a notes.json (plus its change log, if any).
+
+        Returns how many notes were imported, or None if ``cancelled()``
+        turned True first, in which case nothing is. ``report(done, total)``
+        is called after each chunk of notes. The search indexes are filled
+        once at the end rather than by the triggers row by row, and the lock
+        is only held a chunk at a time, so this can run on a worker thread.
+        """
+        if not os.path.exists(path):
+            return 0
+        notes, category_colors = JournalStore(path, None).load()
+        tables = [table for table, exists in (("notes_fts", self.has_fts), ("notes_words", self.has_words))
+                  if exists]
+        triggers = (_FTS_TRIGGERS if self.has_fts else ()) + (_WORDS_TRIGGERS if self.has_words else ())
+        with self._lock:
+            for trigger in triggers:
+                self._db.execute("DROP TRIGGER IF EXISTS %s" % trigger)
+            self._db.execute("BEGIN")
+        try:
+            for start in range(0, len(notes), chunk):
+                if cancelled is not None and cancelled():
+                    with self._lock:
+                        self._db.execute("ROLLBACK")
+                    return None
+                with self._lock:
+                    self._db.executemany(_UPSERT, (_note_row(note) for note in notes[start:start + chunk]))
+                if report is not None:
+                    report(min(start + chunk, len(notes)), len(notes))
+            with self._lock:
+                for table in tables:  # Triggers are off; index every row in one go
+                    self._db.execute("INSERT INTO %s (%s) VALUES ('delete-all')" % (table, table))
+                    self._db.execute("INSERT INTO %s (rowid, title, category, body) "
+                                     "SELECT rowid, title, category, muze_text(body) FROM notes" % table)
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO category_colors (category, color) VALUES (?, ?)",
+                    ((category, json.dumps(list(color))) for category, color in category_colors.items()))
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_from', ?)",
+                                 (os.path.abspath(path),))
+                self._db.execute("COMMIT")
+        except Exception:
+            with self._lock:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+            raise
+        finally:
+            with self._lock:  # Triggers back on
+                self._db.executescript((_FTS_SCHEMA if self.has_fts else "") + (_WORDS_SCHEMA if self.has_words else ""))
+        return len(notes)
+
+    def delete_note(self, note):
+        with self._lock:
+            super().delete_note(note)
+
+    def _unlist(self, note):
+        if self._streamed.pop(note["id"], None) is not None:
+            self._notes = None
+        else:
+            super()._unlist(note)  # Added since loading, or not streamed in yet
+
+    def _write_note(self, note):
+        row = _note_row(note)
+        with self._lock:
+            if "notes" in note:
+                self._db.execute(_UPSERT, row)
+            else:
+                # A header: leave the body and URL in the database alone
+                note_id, title, url, body, preview, category, color, favorite, extra = row
+                self._db.execute(_UPDATE_HEADER, (title, category, color, favorite, extra, note_id))
+
+    def _remove_note(self, note):
+        with self._lock:
+            self._db.execute("DELETE FROM notes WHERE id = ?", (note["id"],))
+
+    def _write_category_color(self, category, color):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO category_colors (category, color) VALUES (?, ?)",
+                             (category, json.dumps(list(color))))
+
+    def _notes_for(self, ids):
+        """The note dicts for ids, reading headers for any not loaded yet."""
+        with self._lock:
+            missing = [note_id for note_id in ids if note_id not in self._by_id]
+            for start in range(0, len(missing), 500):  # Stay under SQLite's variable limit
+                chunk = missing[start:start + 500]
+                for row in self._db.execute(
+                        "SELECT %s FROM notes WHERE id IN (%s)" % (_HEADER_COLUMNS, ",".join("?" * len(chunk))),
+                        chunk):
+                    self._track(_header_note(row))
+            return [self._by_id[note_id] for note_id in ids if note_id in self._by_id]
+
+    def search(self, query, cancelled=None):
+        terms = query.lower().split()
+        if not terms:
+            return list(self.notes)
+
+        phrases, conditions, params = [], [], []
+        for term in terms:
+            prefix = term.endswith("*") and len(term) > 1
+            needle = term[:-1] if prefix else term
+            if self.has_fts and len(needle) >= 3:
+                phrases.append('"%s"' % needle.replace('"', '""'))  # A quoted phrase is a substring match
+            else:
+                conditions.append("instr(lower(%s), ?) > 0" % _SEARCH_TEXT)
+                params.append(needle)
+            if prefix:
+                conditions.append("muze_word_prefix(%s, ?)" % _SEARCH_TEXT)
+                params.append(needle)
+        if phrases:
+            conditions.insert(0, "n.rowid IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)")
+            params.insert(0, " AND ".join(phrases))
+
+        sql = "SELECT n.id FROM notes n WHERE %s ORDER BY n.position" % " AND ".join(conditions)
+        with self._reading(cancelled):
+            try:
+                ids = [row[0] for row in self._reader.execute(sql, params)]
+            except sqlite3.OperationalError:
+                if cancelled is not None and cancelled():
+                    return None
+                raise
+        return self._notes_for(ids)
+
+    @contextmanager
+    def _reading(self, cancelled):
+        """Hold the search connection, with SQLite polling ``cancelled`` while it works."""
+        with self._reader_lock:
+            if cancelled is not None:
+                # A non-zero return aborts the query with an OperationalError
+                self._reader.set_progress_handler(lambda: 1 if cancelled() else 0, 10000)
+            try:
+                yield
+            finally:
+                self._reader.set_progress_handler(None, 0)
+
+    def rank(self, terms, candidates=None, cancelled=None):
+        if not self.has_words or (candidates is not None and len(candidates) <= RANK_SCAN_LIMIT):
+            return super().rank(terms, candidates, cancelled)
+        with self._reading(cancelled):
+            try:
+                return self._rank_words(terms, candidates, cancelled)
+            except sqlite3.OperationalError:
+                if cancelled is not None and cancelled():
+                    return None
+                raise
+
+    def prepare_search(self, cancelled=None):
+        if not self.has_words:
+            return True
+        with self._reading(cancelled):
+            try:
+                return self._read_vocabulary(cancelled)
+            except sqlite3.OperationalError:
+                if cancelled is not None and cancelled():
+                    return False
+                raise
+
+    def _read_vocabulary(self, cancelled):
+        """Bring the vocabulary up to date with the word index, on the search
+        connection. Returns False if cancelled first."""
+        revision = self.revision
+        if self._vocabulary_revision != revision:
+            words = {row[0] for row in self._reader.execute("SELECT term FROM notes_words_row")}
+            if not self._vocabulary.update(words, cancelled):
+                return False
+            # Writes not committed yet aren't in it; read it again once they are
+            self._vocabulary_revision = None if self._db.in_transaction else revision
+        return True
+
+    def _rank_words(self, terms, candidates, cancelled):
+        """``rank`` from the word index, on the search connection."""
+        if not self._read_vocabulary(cancelled):
+            return None
+        scores = None  # rowid -> score so far, for notes matching every term so far
+        for term in terms:
+            similarities = self._vocabulary.matching(term, cancelled)
+            if similarities is None:
+                return None
+            words = list(similarities)
+            best = {}
+            for start in range(0, len(words), 500):
+                if cancelled is not None and cancelled():
+                    return None
+                chunk = words[start:start + 500]
+                for word, rowid, column in self._reader.execute(
+                        "SELECT DISTINCT term, doc, col FROM notes_words_instance WHERE term IN (%s)"
+                        % ",".join("?" * len(chunk)), chunk):
+                    score = similarities[word] * _COLUMN_WEIGHTS[column]
+                    if score > best.get(rowid, 0.0):
+                        best[rowid] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {rowid: total + best[rowid] for rowid, total in scores.items() if rowid in best}
+            if not scores:
+                return []
+        rowids = list(scores)
+        rows = []
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            rows.extend(self._reader.execute(
+                "SELECT rowid, id, favorite, position FROM notes WHERE rowid IN (%s)"
+                % ",".join("?" * len(chunk)), chunk))
+        wanted = set(candidates) if candidates is not None else None
+        ranked = sorted((-scores[rowid] * (FAVORITE_BOOST if favorite else 1), position, note_id)
+                        for rowid, note_id, favorite, position in rows
+                        if wanted is None or note_id in wanted)
+        return [note_id for _, _, note_id in ranked]
+
+    def _rank_rows(self, candidates):
+        columns = "position, id, title, category, muze_text(body), favorite"
+        with self._reading(None):
+            if candidates is None:
+                rows = self._reader.execute("SELECT %s FROM notes" % columns).fetchall()
+            else:
+                rows = []
+                for start in range(0, len(candidates), 500):
+                    chunk = candidates[start:start + 500]
+                    rows.extend(self._reader.execute("SELECT %s FROM notes WHERE id IN (%s)"
+                                                 % (columns, ",".join("?" * len(chunk))), chunk))
+        rows.sort()  # By position
+        return [row[1:] for row in rows]
+
+    def favorites(self):
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM notes WHERE favorite = 1 ORDER BY position")]
+        return self._notes_for(ids)
+
+    def in_category(self, category):
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM notes WHERE category = ? ORDER BY position", (category,))]
+        return self._notes_for(ids)
+
+    def close(self):
+        with self._reader_lock:
+            if self._reader is not self._db:
+                self._reader.close()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,280 @@
+"""Note persistence: a JSON snapshot plus an append-only log of changes.
+
+Every edit appends one JSON line describing just the note that changed, so the
+cost of a save no longer depends on the size of the collection. Once the log
+has grown about as large as the snapshot, the current state is written out as
+a new snapshot on a background thread and the log starts over.
+
+Edits made within ``flush_delay`` of each other are written to the log as one
+batch from a timer thread, and a note changed twice in that window (say,
+favorited and then saved) is only written once. Snapshots are written to a
+temp file, fsynced and renamed over the old one, so a crash leaves either
+the old or the new file, never half of one; a log line torn by a crash is
+skipped on load.
+
+The snapshot is written by one of the codecs in ``muze.codecs`` (compact
+JSON by default) and any of them is recognized on load; a snapshot in a
+different format than the store's is rewritten in its format right away.
+
+Files, next to each other:
+
+- ``notes.json``: the snapshot
+- ``notes.json.log``: changes since the snapshot, one record per line
+- ``notes.json.log.old``: the log being folded into a snapshot right now
+"""
+import gc
+import os
+import threading
+import uuid
+
+from .codecs import detect, dumps_json, get_codec, loads_json
+
+
+def new_note_id():
+    return uuid.uuid4().hex
+
+
+def _fsync_dir(path):
+    """Make a rename in path's directory durable, where the OS supports it."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows can't open directories
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, write, mode="w"):
+    """Replace the file at path with whatever ``write(f)`` writes to f."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+class JournalStore:
+    """Snapshot + change log for the notes list and category colors.
+
+    ``state`` is a callable returning ``(notes, category_colors)``; it is
+    called on the caller's thread whenever a snapshot needs to be taken.
+    ``codec`` is the snapshot format to write (see ``muze.codecs``).
+    """
+
+    compact_min_records = 200  # Never compact a log shorter than this
+    flush_delay = 0.5  # Seconds edits are held back so they can be batched
+
+    def __init__(self, path, state, codec="json"):
+        self.path = path
+        self.codec = get_codec(codec)
+        self.log_path = path + ".log"
+        self.old_log_path = path + ".log.old"
+        self._state = state
+        self._log = None
+        self._log_records = 0
+        self._snapshot_size = 0  # Notes in the last snapshot
+        self._compactor = None
+
+        self._buffer = {}  # (kind, key) -> serialized record waiting to be written
+        self._buffer_lock = threading.Lock()
+        self._flush_timer = None
+        self._io_lock = threading.Lock()  # Guards the log files
+        self._epoch = 0  # Bumped each time the log is rotated
+
+    def load(self):
+        """Read the snapshot and replay the logs over it.
+
+        Returns ``(notes, category_colors)``. Notes written before ids existed
+        get one, as does the second of two notes sharing an id (say, from a
+        hand-edited file); ``needs_compaction`` is set so the ids get saved.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            blob = b""
+        collecting = gc.isenabled()
+        gc.disable()  # One new dict per note, none in a cycle; collecting mid-parse is wasted time
+        try:
+            data = detect(blob).loads(blob) if blob.strip() else {}
+        finally:
+            if collecting:
+                gc.enable()
+        notes = data.get("notes", [])  # Handle missing "notes" key
+        category_colors = data.get("category_colors", {})  # Handle missing "category_colors" key
+        self._snapshot_size = len(notes)
+
+        self.needs_compaction = False
+        seen = set()
+        for note in notes:
+            if not note.get("id") or note["id"] in seen:
+                note["id"] = new_note_id()
+                self.needs_compaction = True
+            seen.add(note["id"])
+
+        positions = {note["id"]: i for i, note in enumerate(notes)}
+        replayed = 0
+        for path in (self.old_log_path, self.log_path):
+            for record in self._read_log(path):
+                replayed += 1
+                op = record["op"]
+                if op == "put":
+                    note = record["note"]
+                    position = positions.get(note["id"])
+                    if position is None:
+                        positions[note["id"]] = len(notes)
+                        notes.append(note)
+                    else:
+                        notes[position] = note
+                elif op == "delete":
+                    position = positions.pop(record["id"], None)
+                    if position is not None:
+                        notes[position] = None  # Dropped below, keeps positions valid
+                elif op == "color":
+                    category_colors[record["category"]] = record["color"]
+        notes = [note for note in notes if note is not None]
+
+        self._log_records = replayed
+        if os.path.exists(self.old_log_path):
+            self.needs_compaction = True  # Last compaction didn't finish
+        if not data and not replayed:
+            self.needs_compaction = True  # No file yet; create one
+        elif data and detect(blob).name != self.codec.name:
+            self.needs_compaction = True  # Migrate to the configured format
+        return notes, category_colors
+
+    def _read_log(self, path):
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield loads_json(line)
+                    except ValueError:
+                        continue  # Torn by a crash mid-write
+        except FileNotFoundError:
+            return
+
+    def put_note(self, note):
+        """Record the current contents of a new or edited note."""
+        self._append(("note", note["id"]), {"op": "put", "note": note})
+
+    def delete_note(self, note_id):
+        self._append(("note", note_id), {"op": "delete", "id": note_id})
+
+    def set_category_color(self, category, color):
+        self._append(("color", category), {"op": "color", "category": category, "color": color})
+
+    def _append(self, key, record):
+        line = dumps_json(record)  # Now, while the note can't change under us
+        with self._buffer_lock:
+            self._buffer[key] = line  # Replaces an unwritten change to the same note
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        self._log_records += 1
+        if self._log_records >= max(self.compact_min_records, self._snapshot_size):
+            self.compact()
+
+    def flush(self):
+        """Write buffered changes to the log and fsync it."""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, {}
+            epoch = self._epoch
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not batch:
+            return
+        data = "".join(line + "\n" for line in batch.values())
+
+        with self._io_lock:
+            if epoch == self._epoch:
+                if self._log is None:
+                    self._log = self._open_log()
+                self._log.write(data)
+                self._log.flush()
+                os.fsync(self._log.fileno())
+            elif os.path.exists(self.old_log_path):
+                # The log was rotated while this batch waited; it predates the
+                # snapshot being written, so it belongs with the old log
+                with open(self.old_log_path, "a") as old:
+                    old.write(data)
+                    old.flush()
+                    os.fsync(old.fileno())
+            # Otherwise a finished snapshot already covers these changes
+
+    def _open_log(self):
+        torn = False
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+        except FileNotFoundError:
+            pass
+        log = open(self.log_path, "a")
+        if torn:
+            log.write("\n")  # Don't glue the next record onto a torn line
+        return log
+
+    def compact(self):
+        """Fold the log into a new snapshot on a background thread."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return  # The running one will pick up the next round
+
+        self.flush()  # Everything logged so far goes out with the old log
+        notes, category_colors = self._state()
+        # Copy on this thread so the writer never sees a note mid-edit
+        data = {
+            "notes": [dict(note) for note in notes],
+            "category_colors": dict(category_colors),
+        }
+
+        # Start a fresh log; what's in the old one is covered by the snapshot
+        with self._buffer_lock, self._io_lock:
+            self._epoch += 1
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.old_log_path):
+                    # An earlier compaction never finished; keep its records too
+                    with open(self.old_log_path, "a") as old, open(self.log_path, "r") as log:
+                        old.write(log.read())
+                        old.flush()
+                        os.fsync(old.fileno())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.old_log_path)
+        self._log_records = 0
+        self._snapshot_size = len(data["notes"])
+
+        self._compactor = threading.Thread(target=self._write_snapshot, args=(data,), name="compact")
+        self._compactor.start()
+
+    def _write_snapshot(self, data):
+        blob = self.codec.dumps(data)
+        atomic_write(self.path, lambda f: f.write(blob), mode="wb")
+        with self._io_lock:
+            if os.path.exists(self.old_log_path):
+                os.remove(self.old_log_path)
+
+    def close(self):
+        """Flush pending edits, wait for a running compaction and close the log."""
+        self.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._io_lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -0,0 +1,411 @@
+"""Sync between devices by exchanging only the notes that changed.
+
+Every device keeps sync metadata next to its notes: per note, the version
+stamp of each field and a local sequence number that goes up whenever the
+note is changed here. A sync pushes the notes changed since the last push,
+in batches, and pulls whatever other devices pushed since the last pull, so
+editing 3 notes out of 10,000 moves 3 records.
+
+Conflicts are settled per field, last writer wins. A stamp is
+``[time_ms, device]`` from a hybrid clock (never behind any stamp seen so
+far, so a device with a slow clock can't lose every conflict) with the
+device id breaking ties; every device merging the same records ends up with
+the same notes, whatever order they arrive in. Deleting a note is a field
+(``deleted``) too, so a delete wins over edits made before it was synced.
+
+Peers are dumb stores of record batches; the merging happens on the devices:
+
+- ``FolderPeer``: a folder every device can reach (a shared or synced
+  folder, a memory card). Each push adds one file; nothing is rewritten.
+- ``HttpPeer``: the same over HTTP, against ``serve`` or anything speaking
+  its two endpoints.
+"""
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .codecs import dumps_json, loads_json
+from .repository import NOTE_REMOVED, prepare_note
+from .storage import JournalStore, atomic_write, new_note_id
+
+SYNC_FIELDS = ("title", "url", "notes", "category", "color", "favorite")
+_BODY_FIELDS = ("url", "notes")  # Missing from headers; a header save leaves them alone
+BATCH_SIZE = 500  # Records per push and per pull
+
+
+def _digest(value):
+    return zlib.crc32(dumps_json(value).encode("utf-8"))
+
+
+def _check_record(record):
+    """Raise ValueError unless ``record`` is shaped like the ones devices push."""
+    if not (isinstance(record, dict) and isinstance(record.get("id"), str) and record["id"]
+            and isinstance(record.get("values"), dict) and isinstance(record.get("stamps"), dict)
+            and all(isinstance(stamp, list) and len(stamp) == 2 and isinstance(stamp[0], int)
+                    and isinstance(stamp[1], str) for stamp in record["stamps"].values())):
+        raise ValueError("Malformed sync record: %.100r" % (record,))
+
+
+class SyncEngine:
+    """Tracks changes to ``repository`` and merges them with a peer's.
+
+    Metadata lives in a JournalStore at ``path`` (plus ``path + ".state"``
+    for the device id and how far pushes and pulls got). Create the engine
+    after the repository is loaded; notes it hasn't seen before are taken
+    on as changes to push.
+
+    ``sync(peer)`` does a whole round on the calling thread. The app splits
+    it up instead: ``outgoing`` and ``merge`` touch the repository and run
+    on the main thread, the peer's ``push`` and ``pull`` can run anywhere.
+    """
+
+    def __init__(self, repository, path, device=None):
+        self.repository = repository
+        self.state_path = path + ".state"
+        self.state = {"device": device or new_note_id(), "pushed": 0, "cursor": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.state.update(json.load(f))
+        self.device = self.state["device"]
+        self._records = {}  # id -> metadata record
+        self.store = JournalStore(path, lambda: (list(self._records.values()), {}))
+        records, _ = self.store.load()
+        self._records = {record["id"]: record for record in records}
+        # The change log: records of notes changed here, in order of seq, newest last
+        self._changes = {record["id"]: record for record in sorted(records, key=lambda record: record["seq"])
+                         if record["seq"]}
+        self._seq = max((record["seq"] for record in records), default=0)
+        self._clock = max((stamp[0] for record in records for stamp in record["stamps"].values()), default=0)
+        self._merging = False
+        self.adopt()
+        repository.watch(self.on_note_changed)
+
+    def _stamp(self):
+        self._clock = max(int(time.time() * 1000), self._clock + 1)
+        return [self._clock, self.device]
+
+    def adopt(self):
+        """Take on notes added, edited or deleted while the engine wasn't
+        watching (or before sync was set up). Only notes whose ``rev`` isn't
+        the one last seen are looked at."""
+        revisions = self.repository.revisions()
+        for note_id, rev in revisions.items():
+            record = self._records.get(note_id)
+            if record is not None and not record["deleted"] and record.get("rev") == rev:
+                continue
+            note = self.repository.get(note_id)
+            header = "notes" not in note
+            if header:
+                self.repository.load_body(note)
+            self._track(note, None if record is not None else [0, self.device])  # New ones lose to any real edit
+            if header:
+                self.repository.unload_body(note)
+        for note_id, record in list(self._records.items()):
+            if note_id not in revisions and not record["deleted"]:
+                self._track_delete(note_id)
+        self.store.flush()
+
+    def on_note_changed(self, event, note):
+        if self._merging:
+            return  # Stamped by merge already
+        if event == NOTE_REMOVED:
+            self._track_delete(note["id"])
+        else:
+            self._track(note)
+
+    def _track(self, note, stamp=None):
+        """Stamp the fields of ``note`` that changed since it was last seen."""
+        record = self._records.get(note["id"])
+        if record is None:
+            record = {"id": note["id"], "seq": 0, "stamps": {}, "digests": {}, "deleted": False}
+        rev = note.get("rev", 0)
+        changed = False
+        for field in SYNC_FIELDS:
+            if field not in note:
+                if field in _BODY_FIELDS:
+                    continue  # A header
+                value = False if field == "favorite" else None
+            else:
+                value = note[field]
+            digest = _digest(value)
+            if record["digests"].get(field) != digest:
+                record["digests"][field] = digest
+                record["stamps"][field] = stamp or self._stamp()
+                changed = True
+        if record["deleted"] or "deleted" not in record["stamps"]:
+            record["deleted"] = False
+            record["stamps"]["deleted"] = stamp or self._stamp()
+            changed = True
+        if changed:
+            record["rev"] = rev
+            self._changed(record)
+        elif record.get("rev") != rev:
+            record["rev"] = rev  # Nothing to push, but adopt needn't look at this version again
+            self.store.put_note(record)
+
+    def _track_delete(self, note_id):
+        record = self._records.get(note_id)
+        if record is None or record["deleted"]:
+            return
+        record["deleted"] = True
+        record["stamps"]["deleted"] = self._stamp()
+        self._changed(record)
+
+    def _changed(self, record):
+        self._seq += 1
+        record["seq"] = self._seq
+        self._records[record["id"]] = record
+        self._changes.pop(record["id"], None)
+        self._changes[record["id"]] = record
+        self.store.put_note(record)
+
+    def pending(self):
+        """How many notes changed here since the last push."""
+        count = 0
+        for record in reversed(self._changes.values()):
+            if record["seq"] <= self.state["pushed"]:
+                break
+            count += 1
+        return count
+
+    def outgoing(self):
+        """Records for every note changed since the last push, oldest change
+        first, as ``(seq, record)``. Call on the main thread."""
+        changed = []
+        for record in reversed(self._changes.values()):
+            if record["seq"] <= self.state["pushed"]:
+                break
+            changed.append(record)
+        changed.reverse()
+        outgoing = []
+        for record in changed:
+            values = self._outgoing(record)  # May turn it into a delete, with a new seq
+            outgoing.append((record["seq"], values))
+        outgoing.sort(key=lambda change: change[0])
+        return outgoing
+
+    def _outgoing(self, record):
+        note = None if record["deleted"] else self.repository.get(record["id"])
+        if note is None:
+            self._track_delete(record["id"])  # Gone without us hearing of it
+        values = {"deleted": record["deleted"]}
+        if not record["deleted"]:
+            header = "notes" not in note
+            if header:
+                self.repository.load_body(note)
+            for field in SYNC_FIELDS:
+                if field in record["stamps"]:
+                    value = note.get(field)
+                    values[field] = list(value) if isinstance(value, tuple) else value
+            if header:
+                self.repository.unload_body(note)
+        stamps = {field: stamp for field, stamp in record["stamps"].items() if field in values}
+        return {"id": record["id"], "values": values, "stamps": stamps}
+
+    def mark_pushed(self, seq):
+        self.state["pushed"] = max(self.state["pushed"], seq)
+        self.save_state()
+
+    def merge(self, incoming):
+        """Merge one record from another device into the notes. Call on the
+        main thread, ideally inside a repository batch. A malformed record
+        raises ValueError before anything is changed."""
+        _check_record(incoming)
+        record = self._records.get(incoming["id"])
+        if record is None:
+            record = {"id": incoming["id"], "seq": 0, "stamps": {}, "digests": {}, "deleted": True}
+        won = {}
+        for field, stamp in incoming["stamps"].items():
+            self._clock = max(self._clock, stamp[0])
+            if field not in incoming["values"] or (field != "deleted" and field not in SYNC_FIELDS):
+                continue
+            if field not in record["stamps"] or stamp > record["stamps"][field]:
+                record["stamps"][field] = stamp
+                won[field] = incoming["values"][field]
+        if not won:
+            return
+        if "deleted" in won:
+            record["deleted"] = won["deleted"]
+        self._records.setdefault(record["id"], record)
+        self._merging = True
+        try:
+            note = self._apply(record, won)
+        finally:
+            self._merging = False
+        if note is not None:
+            for field in SYNC_FIELDS:
+                if field in note:
+                    record["digests"][field] = _digest(note[field])  # So only later edits count as changes
+            record["rev"] = note["rev"]
+        self.store.put_note(record)
+
+    def _apply(self, record, won):
+        repository = self.repository
+        note = repository.get(record["id"])
+        if record["deleted"]:
+            if note is not None:
+                repository.delete_note(note)
+            return None
+        fields = {field: value for field, value in won.items() if field != "deleted"}
+        header = False
+        if note is None:
+            note = {"id": record["id"], "title": "", "url": "", "notes": "", "category": "", "favorite": False}
+        elif any(field in _BODY_FIELDS for field in fields):
+            header = "notes" not in note
+            repository.load_body(note)
+        note.update(fields)
+        prepare_note(note)
+        category = note.get("category", "")
+        if category not in repository.category_colors and note.get("color") is not None:
+            repository.set_category_color(category, note["color"])
+        repository.put_note(note)
+        if header:
+            repository.unload_body(note)
+        return note
+
+    def merged(self, cursor):
+        """Record how far the pull got, once its records are merged."""
+        self.state["cursor"] = cursor
+        self.save_state()
+
+    def save_state(self):
+        self.store.flush()  # Metadata first, so state never runs ahead of it
+        atomic_write(self.state_path, lambda f: json.dump(self.state, f))
+
+    def sync(self, peer, batch_size=BATCH_SIZE):
+        """Push local changes, then pull and merge the peer's; returns
+        ``(pushed, pulled)`` record counts."""
+        changes = self.outgoing()
+        for start in range(0, len(changes), batch_size):
+            batch = changes[start:start + batch_size]
+            peer.push(self.device, [record for _, record in batch])
+            self.mark_pushed(batch[-1][0])
+        pulled = 0
+        with self.repository.batch():
+            while True:
+                records, cursor = peer.pull(self.device, self.state["cursor"], batch_size)
+                if not records:
+                    break
+                for record in records:
+                    self.merge(record)
+                pulled += len(records)
+                self.merged(cursor)
+        return len(changes), pulled
+
+    def close(self):
+        self.repository.unwatch(self.on_note_changed)
+        self.save_state()
+        self.store.close()
+
+
+_BATCH_FILE = re.compile(r"^(\w+)-(\d+)\.jsonl$")
+
+
+class FolderPeer:
+    """Record batches as files in a folder, one file per push, named
+    ``<device>-<number>.jsonl``. The cursor is the last number read per device."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _batches(self):
+        batches = []
+        for name in os.listdir(self.directory):
+            match = _BATCH_FILE.match(name)
+            if match:
+                batches.append((match.group(1), int(match.group(2)), name))
+        return batches
+
+    def push(self, device, records):
+        if not records:
+            return
+        with self._lock:
+            number = max((n for d, n, _ in self._batches() if d == device), default=0) + 1
+            data = "".join(dumps_json(record) + "\n" for record in records)
+            path = os.path.join(self.directory, "%s-%08d.jsonl" % (device, number))
+            atomic_write(path, lambda f: f.write(data))
+
+    def pull(self, device, cursor, limit=BATCH_SIZE):
+        """Records pushed by other devices after ``cursor``, a batch file at a
+        time up to about ``limit``; returns ``(records, cursor)``."""
+        cursor = dict(cursor)
+        records = []
+        for other, number, name in sorted(self._batches(), key=lambda batch: (batch[1], batch[0])):
+            if other == device or number <= cursor.get(other, 0):
+                continue
+            if records and len(records) >= limit:
+                break
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                records.extend(loads_json(line) for line in f if line.strip())
+            cursor[other] = number
+        return records, cursor
+
+
+class HttpPeer:
+    """A peer over HTTP: ``POST <url>/push`` and ``POST <url>/pull`` with JSON
+    bodies, as served by ``serve``."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, endpoint, payload):
+        request = urllib.request.Request(
+            self.url + endpoint, data=dumps_json(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return loads_json(response.read())
+
+    def push(self, device, records):
+        if records:
+            self._post("/push", {"device": device, "records": records})
+
+    def pull(self, device, cursor, limit=BATCH_SIZE):
+        reply = self._post("/pull", {"device": device, "cursor": cursor, "limit": limit})
+        return reply["records"], reply["cursor"]
+
+
+def serve(peer, host="127.0.0.1", port=0):
+    """An HTTP server in front of ``peer`` (say, a FolderPeer), running on a
+    daemon thread; ``server.server_address`` has the port it got. Stop it
+    with ``server.shutdown()``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = loads_json(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.path == "/push":
+                peer.push(payload["device"], payload["records"])
+                reply = {}
+            elif self.path == "/pull":
+                records, cursor = peer.pull(payload["device"], payload["cursor"], payload["limit"])
+                reply = {"records": records, "cursor": cursor}
+            else:
+                self.send_error(404)
+                return
+            body = dumps_json(reply).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Quiet; the app logs sync results itself
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="sync-server", daemon=True).start()
+    return server
+
+
+def open_peer(target):
+    """A peer for a folder path or an http(s) URL."""
+    if target.startswith(("http://", "https://")):
+        return HttpPeer(target)
+    return FolderPeer(target)
@@ -1,11 +1,13 @@
-import json
 import os
 from kivymd.app import MDApp
 from kivymd.uix.screen import MDScreen
 from kivymd.uix.textfield import MDTextField
 from kivymd.uix.button import MDFloatingActionButton
-from kivymd.uix.gridlayout import MDGridLayout
-from kivy.uix.scrollview import ScrollView
+from kivymd.uix.recycleview import MDRecycleView
+from kivymd.uix.recyclegridlayout import MDRecycleGridLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.properties import BooleanProperty, ObjectProperty, StringProperty
+from kivy.metrics import dp
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivy.uix.textinput import TextInput
@@ -13,25 +15,208 @@ from kivymd.uix.button import MDRaisedButton
 from kivymd.uix.card import MDCard
 from kivymd.uix.button import MDIconButton
 from kivymd.uix.label import MDLabel
+from kivymd.uix.progressbar import MDProgressBar
+from kivymd.uix.menu import MDDropdownMenu
 from kivy.clock import Clock
 from kivy.core.window import Window
+from kivy.logger import Logger
 import random
+import time
 
+from muze.bulk import BackgroundTask, BulkJob, Cancelled, import_note, read_notes, write_jsonl, write_markdown
+from muze.instrumentation import Recorder
+from muze.pipeline import SearchPipeline
+from muze.ranking import RankedSearch, query_terms
+from muze.repository import (
+    NOTE_ADDED, NOTE_FAVORITE_CHANGED, NOTE_REMOVED, NOTES_CHANGED, JsonNoteRepository, note_preview,
+    prepare_note,
+)
+from muze.sqlite_repository import SqliteNoteRepository
+from muze.storage import new_note_id
+from muze.sync import SyncEngine, open_peer
 
 
+DEFAULT_NOTE_COLOR = (0.5, 0.7, 0.8, 1)
+
+
+class NoteCard(RecycleDataViewBehavior, MDCard):
+    """Card view for one note. Instances are pooled by the recycle view and
+    rebound to whichever note scrolls into their slot."""
+
+    note = ObjectProperty(None, allownone=True)  # The note dict this card currently shows
+    title = StringProperty("")
+    preview = StringProperty("")
+    favorite = BooleanProperty(False)
+    selected = BooleanProperty(False)  # Picked for a bulk action
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            orientation="vertical",
+            padding="10dp",
+            md_bg_color=DEFAULT_NOTE_COLOR,
+            line_width=dp(2),
+            **kwargs
+        )
+
+        # Create a BoxLayout for the text area
+        text_layout = MDBoxLayout(
+            orientation="vertical",
+            size_hint_y=None,
+            height="80dp",  # Set a height for the text layout
+            spacing="5dp",  # Space between title and preview
+        )
+
+        # Title label
+        self.title_label = MDLabel(
+            theme_text_color="Primary",
+            bold=True,
+            size_hint_y=None,
+            height="40dp",
+            halign="left",  # Align text to the left
+            valign="middle",  # Center vertically in its space
+            font_style="H6",  # Use a larger font style (H6 is larger than the default)
+        )
+        self.title_label.bind(size=self.title_label.setter('text_size'))  # Ensure text wraps if needed
+        text_layout.add_widget(self.title_label)
+
+        # Preview label
+        self.preview_label = MDLabel(
+            theme_text_color="Secondary",
+            size_hint_y=None,
+            height="40dp",  # Adjust height based on your preference
+            halign="left",  # Align text to the left
+            valign="middle",  # Center vertically in its space
+            font_style="Body1",
+            max_lines=3,
+            shorten=True,
+        )
+        self.preview_label.bind(size=self.preview_label.setter('text_size'))  # Ensure text wraps if needed
+        text_layout.add_widget(self.preview_label)
+
+        # Create a horizontal BoxLayout for the text and star icon
+        card_layout = MDBoxLayout(
+            orientation="horizontal",
+            size_hint_y=None,
+            height="40dp",
+            spacing="5dp",
+            padding=[0, 10, 0, 0]  # Adjust padding as necessary
+        )
+        card_layout.add_widget(text_layout)  # Add the text layout to the card layout
+
+        # The star always exists so the widget tree stays the same shape;
+        # it is just hidden for notes that aren't favorites
+        self.star_icon = MDIconButton(
+            icon="star",
+            pos_hint={"center_y": 0.5},  # Center the star icon vertically
+            size_hint=(None, None),
+            size=("24dp", "24dp"),  # Adjust size of the star icon
+            opacity=0,
+            disabled=True,
+        )
+        card_layout.add_widget(self.star_icon)
+
+        self.add_widget(card_layout)
+
+        self.bind(title=self.title_label.setter("text"))
+        self.bind(preview=self.preview_label.setter("text"))
+        self.bind(on_release=self.open_note)  # Bind click to open note for editing
+
+    def on_favorite(self, instance, value):
+        self.star_icon.opacity = 1 if value else 0
+
+    def on_selected(self, instance, value):
+        self.line_color = (1, 1, 1, 1) if value else (0, 0, 0, 0)
+
+    def open_note(self, *args):
+        if self.note is not None:
+            MDApp.get_running_app().open_card(self.note)
+
+
+class PerfOverlay(MDLabel):
+    """Debug readout over the notes list: FPS, card widgets in the grid and
+    the latest operation timings. Only created when NotesApp.perf_overlay is on."""
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            font_style="Caption",
+            theme_text_color="Custom",
+            text_color=(1, 1, 1, 1),
+            md_bg_color=(0, 0, 0, 0.6),
+            size_hint=(0.6, None),
+            height=dp(90),
+            padding=(dp(6), dp(4)),
+            valign="top",
+            **kwargs
+        )
+        self.bind(size=self.setter("text_size"))
+
+    def show(self, fps, widgets, events):
+        lines = ["FPS %.0f   cards %d" % (fps, widgets)]
+        lines += ["%s %.1f ms" % (event["op"], event["ms"]) for event in reversed(events)]
+        self.text = "\n".join(lines)
+
 
 class NotesApp(MDApp):
+    search_debounce = 0.2  # Seconds of typing pause before a search runs
+    ranked_search = True  # Fuzzy matches, best first (see muze.ranking); False for exact ones in list order
+    search_page = 100  # Ranked results shown at first; scrolling to the end shows more
+    storage_backend = "sqlite"  # "sqlite" or "json"
+    snapshot_format = "json"  # notes.json format for the json backend: "json", "json-pretty" or "columnar"
+    startup_page = 60  # Notes loaded (as headers) before the first frame
+    stream_batch = 500  # Notes streamed in per frame after that
+    # Timing of the main operations; the overlay turns it on too. MUZE_PERF=1
+    # in the environment switches both on without a code change.
+    instrumentation = os.environ.get("MUZE_PERF") == "1"
+    perf_overlay = os.environ.get("MUZE_PERF") == "1"
+    perf_overlay_events = 4  # Latest timings shown on the overlay
+    # Folder or http(s) URL to sync with (see muze.sync); no sync without one
+    sync_target = os.environ.get("MUZE_SYNC")
+    sync_batch = 500  # Records per push and per pull
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.notes = []  # Store notes as a list of dictionaries
-        self.categories = []  # List to store categories
+        self.created_at = time.perf_counter()  # For the cold start measurement
+        self.recorder = Recorder(enabled=self.instrumentation or self.perf_overlay)
+        self.selecting = False  # Taps pick notes for a bulk action instead of opening them
+        self.selected = {}  # note id -> note, picked for a bulk action
+        self.bulk_job = None  # Running BulkJob or BackgroundTask, one at a time
+        self.bulk_label = None  # What the running job is doing, for the progress line
+        self.sync_engine = None  # Set up after loading when there's a sync_target
         self.category_colors = {}  # Dictionary to store colors for categories
+        self.category_filter = None  # Category the list is narrowed to, if any
+        self.category_menu = None  # Suggestions under the category field
         self.current_note = None  # Keep track of the current note being edited
+        self.dialog = None  # Note editor, built once and reused
+        self.results_ids = None  # Every ranked result's id, if ranked search results are on show
+        self.results_shown = 0  # How many of results_ids have been shown
+        self.card_cache = {}  # note id -> (revision, recycle view row)
+        self.row_indexes = None  # note id -> index in notes_view.data, rebuilt lazily
         self.notes_file = "notes.json"  # File path for the notes JSON
+        self.notes_db_file = "notes.db"  # File path for the SQLite database
+        self.sync_file = "notes.sync"  # Sync metadata: field stamps and the change log
+        self.repository = self.open_repository()  # Owns the notes; all changes go through it
+        self.repository.bind(self.on_note_changed)  # Patch single rows as notes change
+
+    @property
+    def notes(self):
+        """All notes in display order, as the repository has them right now."""
+        return self.repository.notes
+
+    @property
+    def categories(self):
+        """Categories in use with their note counts (a CategoryIndex)."""
+        return self.repository.categories
+
+    def open_repository(self):
+        if self.storage_backend == "sqlite":
+            # Imports notes.json the first time it runs
+            return SqliteNoteRepository(self.notes_db_file, import_from=self.notes_file)
+        return JsonNoteRepository(self.notes_file, codec=self.snapshot_format)
 
     def build(self):
         self.theme_cls.theme_style = "Dark"  # Set the theme to Dark
         screen = MDScreen()
+        self.screen = screen
         self.show_favorites = False  # Default state (not showing favorites)
 
         #my notes label
@@ -46,24 +231,33 @@ class NotesApp(MDApp):
             pos_hint={"center_x": 0.5, "center_y": 0.9},
             size_hint_x=0.9,
         )
+        self.ranked = RankedSearch(self.repository, page_size=self.search_page)
+        self.search_pipeline = SearchPipeline(
+            self.recorder.wrap("search", self.run_search), self.show_search_results, debounce=self.search_debounce)
         self.search_bar.bind(text=self.on_search_text)  # Bind to text input to search as you type
         screen.add_widget(self.search_bar)
 
-        # Scroll view for notes list
-        self.scroll_view = ScrollView(
+        # Recycle view for notes list: only the cards on screen (plus a small
+        # margin) exist as widgets, and they get rebound to other notes on scroll
+        self.notes_view = MDRecycleView(
             pos_hint={"center_x": 0.5, "center_y": 0.5},
             size_hint=(0.9, 0.7),
         )
-        screen.add_widget(self.scroll_view)
+        self.notes_view.viewclass = NoteCard
+        self.notes_view.bind(scroll_y=self.on_notes_scroll)  # Next page of ranked results
+        screen.add_widget(self.notes_view)
 
         # Grid layout for notes
-        self.notes_grid = MDGridLayout(
+        self.notes_grid = MDRecycleGridLayout(
             cols=2,
-            adaptive_height=True,
+            default_size=(None, dp(120)),  # Card height, enough for two lines
+            default_size_hint=(1, None),
+            size_hint_y=None,
             padding="10dp",
             spacing="10dp",
         )
-        self.scroll_view.add_widget(self.notes_grid)
+        self.notes_grid.bind(minimum_height=self.notes_grid.setter("height"))
+        self.notes_view.add_widget(self.notes_grid)
 
         # Add note button
         self.add_note_button = MDFloatingActionButton(
@@ -80,137 +274,508 @@ class NotesApp(MDApp):
             on_release=self.toggle_favorites_view,
         )
         screen.add_widget(self.show_favorites_button)
-        return screen  # Return the screen
-
-    def on_start(self):
-        """This method is called after the app starts and the UI is built."""
-        self.load_notes_from_json()  # Load notes from JSON
-        self.load_notes()  # Ensure notes are displayed after loading
-
-    def random_color(self):
-        return (random.random(), random.random(), random.random(), 1)  # RGBA color
 
+        # Category filter button
+        self.category_filter_button = MDIconButton(
+            icon="tag-outline",
+            pos_hint={"center_x": 0.05, "center_y": 0.95},
+            on_release=self.open_category_filter,
+        )
+        screen.add_widget(self.category_filter_button)
 
-    def load_notes_from_json(self):
-        try:
-            with open(self.notes_file, "r") as f:
-                data_loaded = json.load(f) 
-
-                # Load notes with color conversion
-                self.notes = []
-                for note_data in data_loaded.get("notes", []):  # Handle missing "notes" key
-                    if "color" in note_data:
-                        note_data["color"] = tuple(note_data["color"])
-                    self.notes.append(note_data)
-
-                # Load category colors
-                self.category_colors = data_loaded.get("category_colors", {})  # Handle missing "category_colors" key
-
-        except FileNotFoundError:
-            self.notes = []
-            self.category_colors = {}  # Initialize if no file
-            with open(self.notes_file, 'w') as f:
-                json.dump({"notes": self.notes, "category_colors": self.category_colors}, f, indent=4)
-                
-                
-    def load_notes(self):
-        self.notes_grid.clear_widgets()  # Clear current widgets
-        for note in self.notes:
-            self.add_note_to_grid(note)
+        # Select notes for bulk actions
+        self.select_button = MDIconButton(
+            icon="checkbox-multiple-outline",
+            pos_hint={"center_x": 0.85, "center_y": 0.95},
+            on_release=self.toggle_selecting,
+        )
+        screen.add_widget(self.select_button)
 
-    def add_note_to_grid(self, note):
-        # Create a card for each note
-        card = MDCard(
-            size_hint_y=None,
-            height="120dp",  # Increase height to accommodate two lines
-            md_bg_color=note.get("color", (0.5, 0.7, 0.8, 1)),  # Use the note's color or default
-            orientation="vertical",
-            padding="10dp",
-            on_release=lambda x: self.edit_note(note)  # Bind click to open note for editing
+        # Export and import
+        self.tools_button = MDIconButton(
+            icon="dots-vertical",
+            pos_hint={"center_x": 0.15, "center_y": 0.95},
+            on_release=self.open_tools_menu,
         )
+        screen.add_widget(self.tools_button)
 
-        # Create a BoxLayout for the text area
-        text_layout = MDBoxLayout(
+        # Bulk action bar, shown while selecting
+        self.selection_bar = MDBoxLayout(
+            size_hint=(0.75, None),
+            height=dp(48),
+            pos_hint={"x": 0.05, "center_y": 0.1},
+            spacing="5dp",
+        )
+        self.selection_label = MDLabel(text="0 selected", size_hint_x=0.4)
+        self.selection_bar.add_widget(self.selection_label)
+        self.selection_bar.add_widget(MDIconButton(icon="star", on_release=lambda *args: self.bulk_favorite(True)))
+        self.selection_bar.add_widget(MDIconButton(icon="star-off-outline", on_release=lambda *args: self.bulk_favorite(False)))
+        self.selection_bar.add_widget(MDIconButton(icon="tag", on_release=self.open_bulk_category_menu))
+        self.selection_bar.add_widget(MDIconButton(icon="delete", on_release=self.bulk_delete))
+
+        # Progress of a bulk action, export or import, shown while one runs
+        self.progress_box = MDBoxLayout(
             orientation="vertical",
-            size_hint_y=None,
-            height="80dp",  # Set a height for the text layout
-            spacing="5dp",  # Space between title and preview
+            size_hint=(0.9, None),
+            height=dp(40),
+            pos_hint={"center_x": 0.5, "center_y": 0.17},
         )
+        self.progress_label = MDLabel(font_style="Caption", size_hint_y=None, height=dp(20))
+        self.progress_box.add_widget(self.progress_label)
+        self.progress_bar = MDProgressBar(max=100, value=0)
+        self.progress_box.add_widget(self.progress_bar)
+
+        if self.perf_overlay:
+            self.perf_label = PerfOverlay(pos_hint={"x": 0.02, "y": 0.02})
+            screen.add_widget(self.perf_label)
+            Clock.schedule_interval(self.update_perf_overlay, 0.5)
+        return screen  # Return the screen
 
-        # Add title as a label
-        title_label = MDLabel(
-            text=note["title"],
-            theme_text_color="Primary",
-            bold=True,
-            size_hint_y=None,
-            height="40dp",
-            halign="left",  # Align text to the left
-            valign="middle",  # Center vertically in its space
-            font_style="H6",  # Use a larger font style (H6 is larger than the default)
-        )
-        title_label.bind(size=title_label.setter('text_size'))  # Ensure text wraps if needed
-        text_layout.add_widget(title_label)
+    def on_start(self):
+        """This method is called after the app starts and the UI is built."""
+        if self.repository.needs_import():
+            # First start after moving to SQLite: bring notes.json over on a
+            # worker, with progress, and load once it's in
+            self.bulk_label = "Importing"
+            self.bulk_job = BackgroundTask(
+                self.run_import,
+                on_progress=lambda done, total: self.show_progress("Importing", done, total),
+                on_done=self.imported,
+            ).start()
+            return
+        self.start_notes()
+
+    def run_import(self, report, cancelled):
+        """The first-start import, on a worker thread."""
+        count = self.repository.run_import(report, cancelled)
+        if count is None:
+            raise Cancelled()
+        return count
+
+    def imported(self, count, error):
+        self.finish_progress("Importing", count or 0, error)
+        self.start_notes()
+
+    def start_notes(self):
+        """Load and show the notes, once there's nothing left to import."""
+        self.load_notes_from_repository()  # Load the first notes from storage
+        if self.sync_target:
+            self.sync_engine = SyncEngine(self.repository, self.sync_file)  # Starts tracking changes
+        self.load_notes()  # Ensure notes are displayed after loading
+        self.search_pipeline.prepare(self.repository.prepare_search)  # So the first search needn't index
+        Clock.schedule_once(self.log_startup_time)  # Runs right after the first frame
+        Clock.schedule_once(self.prepare_note_dialog, 0.5)  # So the first tap doesn't pay for it
+
+    def log_startup_time(self, dt):
+        elapsed = (time.perf_counter() - self.created_at) * 1000
+        Logger.info("Muze: interactive %.0f ms after start (%d notes loaded)" % (elapsed, len(self.notes)))
+        self.recorder.record("startup", elapsed, notes=len(self.notes))
+
+    def update_perf_overlay(self, dt):
+        self.perf_label.show(Clock.get_fps(), len(self.notes_grid.children),
+                             self.recorder.recent(self.perf_overlay_events))
+
+    def export_perf(self):
+        """Write the recorded timings to perf.json in the app's data directory."""
+        if self.recorder.enabled:
+            path = os.path.join(self.user_data_dir, "perf.json")
+            self.recorder.export_json(path)
+            Logger.info("Muze: timings written to %s" % path)
+
+    def prepare_note_dialog(self, dt):
+        if self.dialog is None:
+            self.build_note_dialog()
+
+    def on_pause(self):
+        """Android may kill a paused app without calling on_stop, so write out
+        anything still waiting in the store's batch."""
+        with self.recorder.measure("flush"):
+            self.repository.flush()
+            if self.sync_engine is not None:
+                self.sync_engine.save_state()
+        self.export_perf()
+        return True  # Allow pausing
+
+    def on_stop(self):
+        if isinstance(self.bulk_job, BulkJob):
+            self.bulk_job.stop()  # Ends the repository batch so its changes are saved
+        self.search_pipeline.stop()
+        if self.sync_engine is not None:
+            self.sync_engine.close()
+        self.repository.close()  # Flushes pending edits first
+        self.export_perf()
 
-        # Add preview of the note as a label with fallback for missing "preview"
-        preview_text = note.get("notes", "No content available")[:50] + "..."  # Get the first 50 characters or fallback message
-        preview_label = MDLabel(
-            text=preview_text,  # Use your note's preview text
-            theme_text_color="Secondary",
-            size_hint_y=None,
-            height="40dp",  # Adjust height based on your preference
-            halign="left",  # Align text to the left
-            valign="middle",  # Center vertically in its space
-            font_style="Body1",
-            max_lines=3,
-            shorten=True,
-        )
-        preview_label.bind(size=preview_label.setter('text_size'))  # Ensure text wraps if needed
-        text_layout.add_widget(preview_label)
+    def random_color(self):
+        return (random.random(), random.random(), random.random(), 1)  # RGBA color
 
-        # Create a horizontal BoxLayout for the text and star icon
-        card_layout = MDBoxLayout(
-            orientation="horizontal",
-            size_hint_y=None,
-            height="40dp",
-            spacing="5dp",
-            padding=[0, 10, 0, 0]  # Adjust padding as necessary
-        )
-        
-        card_layout.add_widget(text_layout)  # Add the text layout to the card layout
 
-        # Add a star icon if the note is favorited
-        if note.get("favorite", False):
-            star_icon = MDIconButton(
-                icon="star",
-                pos_hint={"center_y": 0.5},  # Center the star icon vertically
-                size_hint=(None, None),
-                size=("24dp", "24dp")  # Adjust size of the star icon
-            )
-            card_layout.add_widget(star_icon)  # Add star icon to the card layout
-
-        # Add the card layout to the card
-        card.add_widget(card_layout)
-
-        self.notes_grid.add_widget(card)  # Add the card to the grid
-
-    def save_notes_to_json(self):
-        """Save notes and category colors to a JSON file."""
-        data_to_save = {
-            "notes": self.notes,
-            "category_colors": self.category_colors  # Include category colors
+    def load_notes_from_repository(self):
+        # Only the first page when the backend can load lazily; notes come
+        # back with colors already converted to tuples
+        with self.recorder.measure("load", limit=self.startup_page):
+            _, self.category_colors = self.repository.load(limit=self.startup_page)
+        if not self.repository.fully_loaded:
+            Clock.schedule_once(self.stream_notes)
+
+    def stream_notes(self, dt):
+        """Load the next batch of note headers, one batch per frame."""
+        with self.recorder.measure("load_more"):
+            index, notes = self.repository.load_more(self.stream_batch)
+        if notes and not self.show_favorites and self.category_filter is None and not self.search_bar.text.strip():
+            # Favorites and search results come from queries that already see
+            # every note; only the full list needs the new rows
+            self.notes_view.data[index:index] = [self.note_card_data(note) for note in notes]
+            self.row_indexes = None
+        if not self.repository.fully_loaded:
+            Clock.schedule_once(self.stream_notes)
+
+    def load_notes(self):
+        self.search_pipeline.cancel()  # A search still running would show stale results
+        self.show_notes(self.notes)
+
+    def show_notes(self, notes):
+        """Hand the given notes to the recycle view. No widgets are created here,
+        the view only builds/rebinds cards for the rows that are visible."""
+        self.results_ids = None
+        with self.recorder.measure("grid_build", rows=len(notes)):
+            self.notes_view.data = [self.note_card_data(note) for note in notes]
+        self.row_indexes = None
+
+    def row_index(self, note):
+        """Index of a note's row in the list, or None if it isn't shown."""
+        if self.row_indexes is None:
+            self.row_indexes = {row["note"]["id"]: i for i, row in enumerate(self.notes_view.data)}
+        return self.row_indexes.get(note["id"])
+
+    def on_note_changed(self, event, note):
+        """Patch the one row a note change affects instead of reloading the list.
+        Assigning a single item of the view's data only refreshes that card."""
+        if event == NOTES_CHANGED:
+            # A bulk change: reload whatever is shown, once
+            self.card_cache.clear()
+            if self.search_bar.text.strip():
+                self.search_pipeline.submit(self.search_bar.text)
+            else:
+                self.update_notes_grid(0)
+            return
+        data = self.notes_view.data
+        index = self.row_index(note)
+        if event == NOTE_REMOVED:
+            self.selected.pop(note["id"], None)
+            self.card_cache.pop(note["id"], None)
+            if index is not None:
+                del data[index]
+                self.row_indexes = None  # Later rows moved up
+            return
+
+        # Favorites view only shows favorites, a category filter only its
+        # category; search results are left alone for new notes since we
+        # don't know if they'd match
+        belongs = (not self.show_favorites or note.get("favorite", False)) and (
+            self.category_filter is None or note.get("category", "") == self.category_filter)
+        if index is not None and not belongs:
+            del data[index]  # Unfavorited while looking at favorites
+            self.row_indexes = None
+        elif index is not None:
+            data[index] = self.note_card_data(note)
+        elif belongs and (event == NOTE_ADDED or event == NOTE_FAVORITE_CHANGED) and not self.search_bar.text.strip():
+            self.row_indexes[note["id"]] = len(data)
+            data.append(self.note_card_data(note))
+
+    def note_card_data(self, note):
+        """The recycle view row for a note. Rows are cached per note and only
+        rebuilt once the note's revision changes, so switching between all
+        notes, favorites and search results reuses them."""
+        revision = note.get("rev", 0)
+        cached = self.card_cache.get(note["id"])
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        data = {
+            "note": note,
+            "title": note["title"],
+            "preview": note_preview(note),
+            "favorite": note.get("favorite", False),
+            "md_bg_color": note.get("color", DEFAULT_NOTE_COLOR),  # Use the note's color or default
+            "selected": False,
         }
-        with open(self.notes_file, 'w') as f:
-            json.dump(data_to_save, f, indent=4)   
-            
+        self.card_cache[note["id"]] = (revision, data)
+        if note["id"] in self.selected:
+            return dict(data, selected=True)
+        return data
+
+    def open_card(self, note):
+        """A tap on a card: open the note, or pick it while selecting."""
+        if self.selecting:
+            self.toggle_selected(note)
+        else:
+            self.edit_note(note)
+
+    def toggle_selecting(self, *args):
+        self.selecting = not self.selecting
+        self.select_button.icon = "close" if self.selecting else "checkbox-multiple-outline"
+        if self.selecting:
+            self.screen.add_widget(self.selection_bar)
+            self.add_note_button.disabled = True
+        else:
+            self.screen.remove_widget(self.selection_bar)
+            self.add_note_button.disabled = False
+            picked, self.selected = list(self.selected.values()), {}
+            for note in picked:
+                self.refresh_row(note)
+        self.update_selection_label()
+
+    def toggle_selected(self, note):
+        if self.selected.pop(note["id"], None) is None:
+            self.selected[note["id"]] = note
+        self.refresh_row(note)
+        self.update_selection_label()
+
+    def refresh_row(self, note):
+        index = self.row_index(note)
+        if index is not None:
+            self.notes_view.data[index] = self.note_card_data(note)
+
+    def update_selection_label(self):
+        self.selection_label.text = "%d selected" % len(self.selected)
+
+    def take_selection(self):
+        """The picked notes, leaving selection mode."""
+        notes = list(self.selected.values())
+        if self.selecting:
+            self.toggle_selecting()
+        return notes
+
+    def bulk_favorite(self, favorite):
+        notes = self.take_selection()
+        self.run_bulk("Updating", notes, lambda note: self.repository.set_favorite(note, favorite))
+
+    def bulk_delete(self, *args):
+        notes = self.take_selection()
+        self.run_bulk("Deleting", notes, self.repository.delete_note)
+
+    def open_bulk_category_menu(self, *args):
+        items = [{
+            "viewclass": "OneLineListItem",
+            "text": "%s (%d)" % (category, self.categories.count(category)),
+            "height": dp(48),
+            "on_release": lambda category=category: self.bulk_set_category(category),
+        } for category in self.categories.complete("", limit=None)]
+        self.bulk_category_menu = MDDropdownMenu(caller=self.selection_bar, items=items, width_mult=4,
+                                                 max_height=dp(320))
+        self.bulk_category_menu.open()
+
+    def bulk_set_category(self, category):
+        self.bulk_category_menu.dismiss()
+        notes = self.take_selection()
+        if category not in self.category_colors:
+            self.repository.set_category_color(category, self.random_color())
+        self.run_bulk("Moving", notes, lambda note: self.repository.set_category(note, category))
+
+    def run_bulk(self, label, items, apply, total=None, then=None):
+        """Apply a change to many notes, a batch per frame, with one save and one
+        list refresh at the end (see BulkJob). ``then()`` runs if every item
+        was applied."""
+        if self.bulk_job is not None:
+            return  # One at a time
+        if total is None and isinstance(items, list):
+            total = len(items)
+
+        def done(count, error):
+            if error is None and then is not None:
+                then()
+            self.finish_progress(label, count, error)
+        self.bulk_label = label
+        self.bulk_job = BulkJob(
+            self.repository, items, apply, total=total,
+            on_progress=lambda done, total: self.show_progress(label, done, total),
+            on_done=done,
+        ).start()
+
+    def show_progress(self, label, done, total):
+        if self.progress_box.parent is None:
+            self.screen.add_widget(self.progress_box)
+        self.progress_bar.value = 100.0 * done / total if total else 0
+        self.progress_label.text = "%s: %d of %d" % (label, done, total) if total else "%s: %d" % (label, done)
+
+    def finish_progress(self, label, count, error):
+        self.bulk_job = None
+        if isinstance(error, Cancelled):
+            message = "%s: stopped after %d" % (label, count)
+        elif error is not None:
+            Logger.warning("Muze: %s failed: %r" % (label.lower(), error))
+            message = "%s failed after %d: %s" % (label, count, error)
+        else:
+            message = "%s: done, %d notes" % (label, count)
+        self.show_progress(label, 1, 1)
+        self.progress_label.text = message
+        Clock.schedule_once(lambda dt: self.screen.remove_widget(self.progress_box), 3)
+
+    def export_path(self, markdown):
+        directory = os.path.join(self.user_data_dir, "export")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, "notes-markdown" if markdown else "notes.jsonl")
+
+    def open_tools_menu(self, *args):
+        entries = [
+            ("Export JSON Lines", lambda: self.export_notes(markdown=False)),
+            ("Export Markdown folder", lambda: self.export_notes(markdown=True)),
+            ("Import JSON Lines", lambda: self.import_notes(markdown=False)),
+            ("Import Markdown folder", lambda: self.import_notes(markdown=True)),
+        ]
+        entries.append(("Ranked search: %s" % ("on" if self.ranked_search else "off"), self.toggle_ranked_search))
+        if self.sync_engine is not None:
+            entries.insert(0, ("Sync now (%d changed)" % self.sync_engine.pending(), self.sync_now))
+        if self.bulk_job is not None:
+            entries = [("Stop %s" % self.bulk_label.lower(), lambda job=self.bulk_job: job.cancel())]
+
+        def pick(action):
+            self.tools_menu.dismiss()
+            action()
+        self.tools_menu = MDDropdownMenu(caller=self.tools_button, width_mult=4, items=[{
+            "viewclass": "OneLineListItem",
+            "text": text,
+            "height": dp(48),
+            "on_release": lambda action=action: pick(action),
+        } for text, action in entries])
+        self.tools_menu.open()
+
+    def export_notes(self, markdown):
+        """Write every note to the export folder on a worker thread."""
+        if self.bulk_job is not None:
+            return
+        path = self.export_path(markdown)
+        notes = self.repository.export_notes()
+        total = self.repository.count()
+        write = write_markdown if markdown else write_jsonl
+        label = self.bulk_label = "Exporting"
+        self.bulk_job = BackgroundTask(
+            lambda report, cancelled: write(notes, path, lambda done: report(done, total), cancelled),
+            on_progress=lambda done, total: self.show_progress(label, done, total),
+            on_done=lambda count, error: self.finish_progress(label, count or 0, error),
+        ).start()
+        Logger.info("Muze: exporting to %s" % path)
+
+    def import_notes(self, markdown):
+        """Read notes back from the export folder; notes with an id that's
+        already here are updated, the rest added."""
+        path = self.export_path(markdown)
+        if not os.path.exists(path):
+            self.show_progress("Import", 0, 0)
+            self.finish_progress("Import", 0, FileNotFoundError("nothing at %s" % path))
+            return
+        self.run_bulk("Importing", read_notes(path), self.import_one)
+
+    def sync_now(self):
+        """Push the notes changed here and merge what other devices pushed.
+
+        Only the peer I/O runs on a worker thread; collecting the changes and
+        merging the incoming ones touch the repository, so they stay on the
+        main thread, the merge a batch per frame like any bulk change.
+        """
+        if self.bulk_job is not None or self.sync_engine is None:
+            return
+        engine = self.sync_engine
+        device, batch_size = engine.device, self.sync_batch
+        try:
+            peer = open_peer(self.sync_target)  # A folder peer creates its folder
+            changes = engine.outgoing()
+        except Exception as e:
+            self.finish_progress("Syncing", 0, e)
+            return
+
+        def exchange(report, cancelled):
+            pushed = 0
+            for start in range(0, len(changes), batch_size):
+                if cancelled():
+                    raise Cancelled()
+                batch = changes[start:start + batch_size]
+                peer.push(device, [record for _, record in batch])
+                pushed = batch[-1][0]
+                report(start + len(batch), len(changes))
+            incoming, cursor = [], engine.state["cursor"]
+            while not cancelled():
+                records, next_cursor = peer.pull(device, cursor, batch_size)
+                if not records:
+                    break
+                incoming.extend(records)
+                cursor = next_cursor
+                report(len(incoming))
+            return pushed, incoming, cursor
+
+        def exchanged(result, error):
+            self.bulk_job = None
+            if error is not None:
+                self.finish_progress("Syncing", 0, error)
+                return
+            pushed, incoming, cursor = result
+            if pushed:
+                engine.mark_pushed(pushed)
+            Logger.info("Muze: sync pushed %d, pulled %d" % (len(changes), len(incoming)))
+            self.run_bulk("Merging", incoming, engine.merge, then=lambda: engine.merged(cursor))
+
+        self.bulk_label = "Syncing"
+        self.bulk_job = BackgroundTask(
+            exchange,
+            on_progress=lambda done, total: self.show_progress("Syncing", done, total),
+            on_done=exchanged,
+        ).start()
+
+    def import_one(self, note):
+        prepare_note(note)
+        category = note.get("category", "")
+        if category not in self.category_colors:
+            self.repository.set_category_color(category, note.get("color") or self.random_color())
+        import_note(self.repository, note)
+
     def add_note(self, instance):
         self.current_note = None  # Reset current note for new note creation
         self.open_note_dialog()  # Open a new note dialog
 
     def open_note_dialog(self):
+        """Show the editor for self.current_note, or for a new note if it's None.
+        The dialog is built once and reused; opening it just refills the fields."""
+        opened_at = time.perf_counter()
         # Initialize temp_note for a new note
         if not self.current_note:
             self.temp_note = {"favorite": False}  # Initialize a temporary note
 
+        if self.dialog is None:
+            self.build_note_dialog()
+
+        self.dialog_title.text = "Edit Note" if self.current_note else "New Note"
+
+        # The star is disabled for new notes
+        self.favorite_button.disabled = not self.current_note
+
+        # Delete button only when editing an existing note
+        if self.current_note and self.delete_button.parent is None:
+            self.buttons_box.add_widget(self.delete_button, index=1)  # Between Cancel and Save
+        elif not self.current_note and self.delete_button.parent is not None:
+            self.buttons_box.remove_widget(self.delete_button)
+
+        # Populate fields if editing an existing note, clear them for a new one
+        note = self.current_note or {}
+        self.title_field.text = note.get("title", "")
+        self.url_field.text = note.get("url", "")
+        self.notes_field.text = note.get("notes", "")
+        self.notes_field.cursor = (0, 0)
+        self.notes_field.reset_undo()  # Don't undo into the previous note
+        self.category_field.text = note.get("category", "")
+
+        # Update the star icon based on whether it's a favorite
+        if note.get("favorite", False):
+            self.favorite_button.icon = "star"  # Filled star
+        else:
+            self.favorite_button.icon = "star-outline"  # Unfilled star
+
+        self.dialog.open()
+        if self.recorder.enabled:
+            # Until the next frame, so drawing the dialog counts too
+            Clock.schedule_once(lambda dt: self.recorder.record(
+                "dialog_open", (time.perf_counter() - opened_at) * 1000))
+
+    def build_note_dialog(self):
+        """Create the editor dialog and its widgets."""
         # Create the content for the dialog
         content = MDBoxLayout(orientation="vertical", spacing="5dp", padding="0dp")  # Remove padding
         content.size_hint_y = None  # Disable automatic height
@@ -224,27 +789,22 @@ class NotesApp(MDApp):
         )
         
         # Dialog title
-        title_label = MDLabel(
-            text="Edit Note" if self.current_note else "New Note", 
+        self.dialog_title = MDLabel(
+            text="New Note",
             bold=True,
             size_hint_x=0.9,  # Push the star icon to the right
             halign="left",  # Align to the left
             valign="middle"  # Vertically center the text
         )
-        title_label.bind(size=title_label.setter('text_size'))  # Make sure text wraps if needed
-        title_box.add_widget(title_label)
+        self.dialog_title.bind(size=self.dialog_title.setter('text_size'))  # Make sure text wraps if needed
+        title_box.add_widget(self.dialog_title)
 
         # Star button for favorites aligned to the right
         self.favorite_button = MDIconButton(
             icon="star-outline",  # Default to unfilled star
-            on_release=self.toggle_favorite if self.current_note else self.no_op,  # Use no-op if it's a new note
+            on_release=self.toggle_favorite,
             pos_hint={"center_y": 0.5},  # Vertically center the star with the title
         )
-        
-        # Optionally disable the star button for new notes
-        if not self.current_note:  # If it's a new note
-            self.favorite_button.disabled = True  # Disable the button
-
         title_box.add_widget(self.favorite_button)
 
         # Add the title box to the content
@@ -264,7 +824,7 @@ class NotesApp(MDApp):
             size_hint_y=None,
             height="40dp",
         )
-        self.category_field.bind(on_text=self.on_category_text)  # Bind the event to filter categories
+        self.category_field.bind(text=self.on_category_text)  # Suggest categories as you type
         content.add_widget(self.category_field)
 
         # URL text field and Go button
@@ -289,23 +849,21 @@ class NotesApp(MDApp):
         content.add_widget(self.notes_field)
 
         # Buttons box for Save, Delete, and Cancel
-        buttons_box = MDBoxLayout(spacing="10dp", size_hint_y=None, height="40dp")
+        self.buttons_box = MDBoxLayout(spacing="10dp", size_hint_y=None, height="40dp")
 
         # Cancel button
         cancel_button = MDRaisedButton(text="Cancel", on_release=self.close_dialog)
-        buttons_box.add_widget(cancel_button)
+        self.buttons_box.add_widget(cancel_button)
 
-        # Delete button if editing an existing note
-        if self.current_note:
-            delete_button = MDRaisedButton(text="Delete", on_release=self.delete_note)
-            buttons_box.add_widget(delete_button)
+        # Delete button, added by open_note_dialog when editing an existing note
+        self.delete_button = MDRaisedButton(text="Delete", on_release=self.delete_note)
 
         # Save button
         save_button = MDRaisedButton(text="Save", on_release=self.save_note)
-        buttons_box.add_widget(save_button)
+        self.buttons_box.add_widget(save_button)
 
         # Add the buttons box to the content
-        content.add_widget(buttons_box)
+        content.add_widget(self.buttons_box)
 
         # Create the dialog
         self.dialog = MDDialog(
@@ -315,31 +873,14 @@ class NotesApp(MDApp):
             pos_hint={'center_x': 0.5, 'center_y': 0.7},
             height="480dp",  # Fixed height for the dialog
         )
-
-        # Populate fields if editing an existing note
-        if self.current_note:
-            self.title_field.text = self.current_note["title"]
-            self.url_field.text = self.current_note["url"]
-            self.notes_field.text = self.current_note["notes"]
-            self.category_field.text = self.current_note.get("category", "")  
-
-        # Update the star icon based on whether it's a favorite
-        if self.current_note and self.current_note.get("favorite", False):
-            self.favorite_button.icon = "star"  # Filled star
-        else:
-            self.favorite_button.icon = "star-outline"  # Unfilled star
-
-        self.dialog.open()
-
-    def no_op(self):
-        pass
-
+        self.dialog.bind(on_dismiss=self.on_dialog_dismiss)
 
     def toggle_favorite(self, *args):
         """Toggle favorite status when the star button is clicked."""
         if self.current_note is None:
             # Initialize a new note if it doesn't exist yet
             self.current_note = {
+                "id": new_note_id(),
                 "title": self.title_field.text.strip(),
                 "url": self.url_field.text.strip(),
                 "notes": self.notes_field.text.strip(),
@@ -347,24 +888,29 @@ class NotesApp(MDApp):
                 "color": self.category_colors.get(self.category_field.text.strip().lower(), self.random_color()),  # Assign color
                 "favorite": False  # Default to not favorited
             }
-            # Append the new note to the notes list
-            self.notes.append(self.current_note)
         
         # Toggle the favorite status
-        self.current_note["favorite"] = not self.current_note.get("favorite", False)
-        
+        favorite = not self.current_note.get("favorite", False)
+
         # Update the star icon based on the new favorite status
-        self.favorite_button.icon = "star" if self.current_note["favorite"] else "star-outline"
+        self.favorite_button.icon = "star" if favorite else "star-outline"
         
-        # Save the notes to JSON immediately to persist the favorite status
-        self.save_notes_to_json()
-        self.update_notes_grid(self.current_note)  # Add this function call to refresh the UI
+        # Save the note immediately to persist the favorite status (adds it if new);
+        # the list updates its card from the change event
+        with self.recorder.measure("save"):
+            self.repository.set_favorite(self.current_note, favorite)
 
 
     def close_dialog(self, *args):
         if self.dialog:
             self.dialog.dismiss()
 
+    def on_dialog_dismiss(self, *args):
+        """Long bodies live compressed on disk; drop this one from memory
+        again so only its preview stays around."""
+        if self.current_note is not None:
+            self.repository.unload_body(self.current_note)
+
     def open_url(self, instance):
         import webbrowser
         url = self.url_field.text
@@ -382,7 +928,7 @@ class NotesApp(MDApp):
             color = self.category_colors[category]
         else:
             color = self.random_color()  # Assign a new random color
-            self.category_colors[category] = color  # Store the color for the category
+            self.repository.set_category_color(category, color)  # Store the color for the category
 
         # If editing an existing note, update it instead of creating a new one
         if self.current_note:
@@ -394,6 +940,7 @@ class NotesApp(MDApp):
         else:
             # Create a new note with the assigned color
             self.current_note = {
+                "id": new_note_id(),
                 "title": title,
                 "url": url,  # Include the URL if needed
                 "notes": notes,
@@ -401,51 +948,117 @@ class NotesApp(MDApp):
                 "color": color,  # Assign the color from the dictionary
                 "favorite": False  # Default value for favorite
             }
-            # Add the category to the list of categories if it doesn't already exist
-            if category not in self.categories:
-                self.categories.append(category)
-
-            # Add the note to the notes list
-            self.notes.append(self.current_note)  # Make sure this line is included
-
-        self.save_notes_to_json()  # Save notes to JSON
-        self.load_notes()  # Reload notes to update the display
+        with self.recorder.measure("save"):
+            self.repository.put_note(self.current_note)  # Saves just this note; the list patches its card
         self.close_dialog()  # Close the dialog after saving
 
     def on_category_text(self, instance, value):
-        """Auto-fill categories based on the input text."""
-        # Convert input to lowercase for case-insensitive matching
-        filtered_categories = [cat for cat in self.categories if value.lower() in cat.lower()]
-        
-        # Here you can implement a dropdown or display filtered suggestions
-        # For example, using MDDropdownMenu to show suggestions
-        print(filtered_categories)  # You can replace this with actual dropdown logic
+        """Suggest existing categories starting with what's been typed, most used first."""
+        if not instance.focus:
+            return  # Filled in by the dialog, not typed
+        suggestions = self.categories.complete(value)
+        if not value.strip() or suggestions == [value.strip().lower()]:
+            suggestions = []  # Nothing typed yet, or already typed in full
+        if not suggestions:
+            if self.category_menu is not None:
+                self.category_menu.dismiss()
+            return
+
+        if self.category_menu is None:
+            self.category_menu = MDDropdownMenu(caller=self.category_field, width_mult=4, max_height=dp(240))
+        self.category_menu.items = [{
+            "viewclass": "OneLineListItem",
+            "text": "%s (%d)" % (category, self.categories.count(category)),
+            "height": dp(48),
+            "on_release": lambda category=category: self.pick_category(category),
+        } for category in suggestions]
+        if self.category_menu.parent is None:
+            self.category_menu.open()
+        else:
+            self.category_menu.set_menu_properties()  # Already open: just show the new items
+
+    def pick_category(self, category):
+        self.category_field.text = category
+        self.category_menu.dismiss()
+
+    def open_category_filter(self, *args):
+        """Menu of categories with note counts; picking one narrows the list to it."""
+        items = [{
+            "viewclass": "OneLineListItem",
+            "text": "All categories",
+            "height": dp(48),
+            "on_release": lambda: self.set_category_filter(None),
+        }]
+        for category in self.categories.complete("", limit=None):
+            items.append({
+                "viewclass": "OneLineListItem",
+                "text": "%s (%d)" % (category, self.categories.count(category)),
+                "height": dp(48),
+                "on_release": lambda category=category: self.set_category_filter(category),
+            })
+        self.category_filter_menu = MDDropdownMenu(
+            caller=self.category_filter_button, items=items, width_mult=4, max_height=dp(320))
+        self.category_filter_menu.open()
+
+    def set_category_filter(self, category):
+        self.category_filter_menu.dismiss()
+        self.category_filter = category
+        self.category_filter_button.icon = "tag" if category is not None else "tag-outline"
+        self.update_notes_grid(0)
 
     def delete_note(self, instance):
-        if self.current_note in self.notes:
-            self.notes.remove(self.current_note)
-        self.save_notes_to_json()  # Save notes to JSON after deleting
-        self.load_notes()  # Reload notes after deleting
+        if self.current_note:
+            with self.recorder.measure("delete"):
+                self.repository.delete_note(self.current_note)  # The list drops its card
         self.close_dialog()
 
     def on_search_text(self, instance, value):
-        """Filter notes based on the search query, including title, category, and notes."""
-        filtered_notes = [
-            note for note in self.notes 
-            if (
-                value.lower() in note["title"].lower() or 
-                value.lower() in note.get("category", "").lower() or 
-                value.lower() in note.get("notes", "").lower()  # Check if value is in notes
-            )
-        ]
-        
-        self.notes_grid.clear_widgets()
-        for note in filtered_notes:
-            self.add_note_to_grid(note)
-            
+        """Filter notes based on the search query, including title, category, and notes.
+        Every word has to match: fuzzily with the best matches first when
+        ranked_search is on, otherwise exactly (a word ending in * matches
+        words starting with it) in list order.
+        The search runs on a worker thread once typing pauses; see SearchPipeline."""
+        if not value.strip():
+            self.load_notes()  # Every note; read here, since streaming changes the list on this thread
+            return
+        self.search_pipeline.submit(value)
+
+    def run_search(self, query, cancelled):
+        """Search on the pipeline's worker thread; returns ``(notes, ids)``,
+        ``ids`` being every ranked result when ``notes`` is just the first page."""
+        if self.ranked_search and query_terms(query):
+            ids = self.ranked.ids(query, cancelled)
+            return None if ids is None else (self.ranked.page(ids, 0), ids)
+        notes = self.repository.search(query, cancelled)
+        return None if notes is None else (notes, None)
+
+    def show_search_results(self, results):
+        notes, ids = results
+        self.show_notes(notes)
+        self.results_ids = ids
+        self.results_shown = self.search_page
+
+    def toggle_ranked_search(self):
+        self.ranked_search = not self.ranked_search
+        if self.search_bar.text.strip():
+            self.search_pipeline.submit(self.search_bar.text)
+
+    def on_notes_scroll(self, view, scroll_y):
+        """Add the next page of ranked results once the list is scrolled to its end.
+        Pages come from the ids the first one was cut from, so nothing is ranked here."""
+        ids = self.results_ids
+        if scroll_y > 0.05 or ids is None or self.results_shown >= len(ids):
+            return
+        notes = self.ranked.page(ids, self.results_shown)
+        self.results_shown += self.search_page
+        notes = [note for note in notes if self.row_index(note) is None]  # Already on show, e.g. saved since
+        self.notes_view.data.extend([self.note_card_data(note) for note in notes])
+        self.row_indexes = None
+
     def edit_note(self, note):
         """Edit an existing note by opening the dialog with the note details pre-filled."""
         self.current_note = note  # Set the current note to the one clicked
+        self.repository.load_body(note)  # Notes may have been loaded without their body
         self.open_note_dialog()  # Open the note dialog with the note's data pre-filled
 
 
@@ -457,38 +1070,29 @@ class NotesApp(MDApp):
         if self.show_favorites:
             self.show_favorites_button.icon = "star"  # Filled star when favorites are shown
             self.show_favorites_button.text = "Show All"  # Change button text
-            self.show_favorite_notes()  # Show only favorite notes
         else:
             self.show_favorites_button.icon = "star-outline"  # Unfilled star when favorites are hidden
             self.show_favorites_button.text = "Show Favorites"  # Reset button text
-            self.load_notes()  # Load all notes
 
-        # Fade out and then back in
+        # Fade out, swap in the favorites or all notes, and fade back in
         self.notes_grid.opacity = 0  # Hide the grid
         Clock.schedule_once(self.update_notes_grid, 0.1)  # Wait a moment before updating
 
     def update_notes_grid(self, dt):
         """Update the notes grid and then make it visible again."""
-        self.notes_grid.clear_widgets()  # Clear current widgets
-        if self.show_favorites:
-            favorite_notes = [note for note in self.notes if note.get("favorite", False)]
-            for note in favorite_notes:
-                self.add_note_to_grid(note)
+        self.search_pipeline.cancel()
+        if self.category_filter is not None:
+            notes = self.repository.in_category(self.category_filter)  # Index lookup, not a scan
+            if self.show_favorites:
+                notes = [note for note in notes if note.get("favorite", False)]
+            self.show_notes(notes)
+        elif self.show_favorites:
+            self.show_notes(self.repository.favorites())
         else:
-            for note in self.notes:
-                self.add_note_to_grid(note)
+            self.show_notes(self.notes)
 
         self.notes_grid.opacity = 1  # Show the grid again
 
 
-
-    def show_favorite_notes(self):
-        """Filter and display only favorite notes."""
-        self.notes_grid.clear_widgets()  # Clear current widgets
-        favorite_notes = [note for note in self.notes if note.get("favorite", False)]  # Filter only favorite notes
-        
-        for note in favorite_notes:
-            self.add_note_to_grid(note)
-
 if __name__ == "__main__":
     NotesApp().run()
@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("kivy")
+
+from muze.bulk import markdown_to_note, read_markdown, write_markdown  # noqa: E402
+
+
+@pytest.mark.parametrize("body", ["", "one line", "trailing newline\n", "two\n\n", "\nleading",
+                                  "windows\r\nlines\r\n", "---\n# not a heading"])
+def test_markdown_round_trip_keeps_bodies(tmp_path, body):
+    note = {"id": "0123456789", "title": "A title", "url": "https://example.com", "notes": body,
+            "category": "work", "favorite": True}
+    directory = str(tmp_path / "export")
+    assert write_markdown([note], directory) == 1
+    (read,) = read_markdown(directory)
+    assert read["notes"] == body
+    assert {key: read[key] for key in note} == note
+
+
+def test_hand_written_markdown_without_front_matter():
+    assert markdown_to_note("# Title\n\nBody\n") == {"title": "Title", "notes": "Body"}
@@ -0,0 +1,95 @@
+from muze.categories import CategoryIndex
+
+
+def _note(note_id, category):
+    return {"id": note_id, "title": note_id, "category": category}
+
+
+def _index(*categories):
+    index = CategoryIndex()
+    notes = [_note("n%d" % i, category) for i, category in enumerate(categories)]
+    index.rebuild(notes)
+    return index, notes
+
+
+def _ids(notes):
+    return [note["id"] for note in notes]
+
+
+def test_complete_ranks_by_use_then_name():
+    index, _ = _index("work", "home", "work", "wishlist", "home", "work", "")
+    assert index.complete("") == ["work", "home", "wishlist"]
+    assert index.complete("w") == ["work", "wishlist"]
+    assert index.complete(" WO ") == ["work"]
+    assert index.complete("x") == []
+
+
+def test_complete_limit():
+    index, _ = _index(*["c%02d" % i for i in range(12)])
+    assert len(index.complete("")) == 8
+    assert index.complete("", limit=3) == ["c00", "c01", "c02"]
+    assert index.complete("", limit=None) == ["c%02d" % i for i in range(12)]
+
+
+def test_colored_categories_are_listed_without_notes():
+    index = CategoryIndex()
+    index.rebuild([_note("a", "work")], categories=["ideas"])
+    assert index.complete("") == ["work", "ideas"]
+    assert index.count("ideas") == 0
+    index.add_name("later")
+    assert "later" in index.complete("", limit=None)
+
+
+def test_moving_a_note_to_another_category():
+    index, notes = _index("work", "work", "home")
+    notes[0]["category"] = "home"
+    index.put(notes[0])
+    assert (index.count("work"), index.count("home")) == (1, 2)
+    assert _ids(index.notes("work")) == ["n1"]
+    assert _ids(index.notes("home")) == ["n0", "n2"]  # First seen first, not last moved
+    notes[0]["category"] = "brand new"
+    index.put(notes[0])
+    assert index.count("home") == 1 and index.count("brand new") == 1
+    assert index.complete("b") == ["brand new"]
+
+
+def test_saving_a_note_again_doesnt_count_it_twice():
+    index, notes = _index("work")
+    index.put(notes[0])
+    index.put(_note("n1", "work"))
+    assert index.count("work") == 2
+    assert _ids(index.notes("work")) == ["n0", "n1"]
+
+
+def test_delete():
+    index, notes = _index("work", "work", "home")
+    index.remove(notes[1])
+    assert index.count("work") == 1
+    assert _ids(index.notes("work")) == ["n0"]
+    index.remove(notes[2])
+    assert index.count("home") == 0 and index.notes("home") == []
+    index.remove(notes[2])  # Twice does nothing
+    assert index.count("home") == 0
+
+
+def test_track_after_rebuild_from_counts():
+    index = CategoryIndex()
+    index.rebuild((), counts={"work": 3, "home": 1})  # Notes not loaded yet
+    assert index.complete("") == ["work", "home"]
+    note = _note("a", "work")
+    index.track(note)
+    assert index.count("work") == 3  # Tracking doesn't count again
+    assert index.notes("work") == [note]
+    note["category"] = "home"
+    index.put(note)  # Knows it's moving out of "work"
+    assert (index.count("work"), index.count("home")) == (2, 2)
+    assert index.notes("work") == [] and index.notes("home") == [note]
+    index.remove(note)
+    assert index.count("home") == 1
+
+
+def test_removing_an_untracked_note_uses_its_category():
+    index = CategoryIndex()
+    index.rebuild((), counts={"work": 2})
+    index.remove(_note("unseen", "work"))
+    assert index.count("work") == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from muze.ranking import RankedSearch
+from muze.repository import JsonNoteRepository
+from muze.sqlite_repository import SqliteNoteRepository
+
+TITLES = ["xabc", "abc", "abde", "android notes", "andriod app", "grocery list",
+          "abc grocery", "xabc list", "note about android groceries"]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def repository(request, tmp_path):
+    if request.param == "json":
+        repository = JsonNoteRepository(str(tmp_path / "notes.json"))
+    else:
+        repository = SqliteNoteRepository(str(tmp_path / "notes.db"))
+    repository.load()
+    for index, title in enumerate(TITLES):
+        repository.put_note({"id": "n%d" % index, "title": title, "category": "", "notes": ""})
+    yield repository
+    repository.close()
+
+
+def _titles(notes):
+    return [note["title"] for note in notes]
+
+
+@pytest.mark.parametrize("queries", [
+    ["ab", "abc"],
+    ["abcd", "abcde"],
+    ["a", "an", "and", "andr", "andro", "androi", "android"],
+    ["abc", "abc g", "abc gr", "abc groc"],
+    ["android", "android note", "android notes"],
+    ["x", "xa", "xab", "xabc", "xabc l", "xabc list"],
+])
+def test_narrowed_results_match_fresh_ones(repository, queries):
+    typed = RankedSearch(repository)
+    for query in queries:
+        assert _titles(typed.search(query)) == _titles(RankedSearch(repository).search(query)), query
+
+
+def test_typing_on_within_a_word_finds_new_matches(repository):
+    ranked = RankedSearch(repository)
+    ranked.search("ab")
+    assert set(_titles(ranked.search("abc"))) >= {"abc", "xabc"}
+    ranked.search("abcd")
+    assert "abde" in _titles(ranked.search("abcde"))
+
+
+def test_pages_come_from_the_ids_ranked_first(repository):
+    ranked = RankedSearch(repository, page_size=2)
+    ids = ranked.ids("a")
+    repository.put_note({"id": "new", "title": "abc abc", "category": "", "notes": ""})
+    shown = [note["id"] for offset in range(0, len(ids), 2) for note in ranked.page(ids, offset)]
+    assert shown == ids
+
+
+def test_notes_saved_in_a_batch_are_found_once_it_ends(repository):
+    ranked = RankedSearch(repository)
+    repository.begin_batch()
+    repository.put_note({"id": "b1", "title": "zebra", "category": "", "notes": ""})
+    repository.put_note({"id": "b2", "title": "zebras", "category": "", "notes": ""})
+    ranked.search("zebra")  # May not see them yet
+    repository.end_batch()
+    assert sorted(note["id"] for note in ranked.search("zebra")) == ["b1", "b2"]
@@ -0,0 +1,24 @@
+from muze.search import SearchIndex
+
+
+def _notes(count):
+    return [{"id": "n%d" % i, "title": "note %d" % i, "category": "", "notes": "kivy body"} for i in range(count)]
+
+
+def test_index_pending_builds_the_index_ahead_of_search():
+    index = SearchIndex()
+    index.rebuild(_notes(3000))
+    assert not index.index_pending(cancelled=lambda: True)
+    assert index.index_pending()
+    assert not index._pending
+    assert len(index.search("kivy")) == 3000
+
+
+def test_search_finishes_what_index_pending_left():
+    index = SearchIndex()
+    index.rebuild(_notes(3000))
+    calls = []
+    index.index_pending(cancelled=lambda: calls.append(1) or len(calls) > 1)  # One batch, then gives up
+    assert index._pending
+    assert [note["id"] for note in index.search("note 2999")] == ["n2999"]
+    assert index.rank(["kivy"])[:2] == ["n0", "n1"]
@@ -0,0 +1,175 @@
+import json
+import sqlite3
+
+import pytest
+
+from muze.repository import PREVIEW_LENGTH
+from muze.sqlite_repository import COMPRESS_MIN_LENGTH, SCHEMA_VERSION, SqliteNoteRepository
+
+
+def _note(index, **fields):
+    note = {"id": "n%d" % index, "title": "note %d" % index, "url": "", "notes": "body %d words" % index,
+            "category": "work" if index % 2 else "", "color": None, "favorite": False}
+    note.update(fields)
+    return note
+
+
+def _write_json(path, notes):
+    with open(path, "w") as f:
+        json.dump({"notes": notes, "category_colors": {"work": [1, 0, 0, 1]}}, f)
+
+
+@pytest.fixture
+def import_paths(tmp_path):
+    json_path = str(tmp_path / "notes.json")
+    _write_json(json_path, [_note(i) for i in range(1200)])
+    return json_path, str(tmp_path / "notes.db")
+
+
+def test_import_on_first_open(import_paths):
+    json_path, db_path = import_paths
+    repository = SqliteNoteRepository(db_path, import_from=json_path)
+    assert repository.needs_import()
+    progress = []
+    assert repository.run_import(lambda done, total: progress.append((done, total))) == 1200
+    assert progress[-1] == (1200, 1200)
+    assert not repository.needs_import()
+    repository.load()
+    assert len(repository.notes) == 1200
+    assert repository.category_colors == {"work": (1, 0, 0, 1)}
+    assert [note["id"] for note in repository.search("note 1199")] == ["n1199"]
+    assert len(repository.rank(["words"])) == 1200
+    repository.put_note(_note(5000, title="afterwards"))  # Triggers are back
+    assert [note["id"] for note in repository.search("afterwards")] == ["n5000"]
+    assert repository.rank(["afterwards"]) == ["n5000"]
+    repository.close()
+
+    reopened = SqliteNoteRepository(db_path, import_from=json_path)
+    assert not reopened.needs_import()
+    reopened.close()
+
+
+def test_cancelled_import_leaves_nothing_and_is_tried_again(import_paths):
+    json_path, db_path = import_paths
+    repository = SqliteNoteRepository(db_path, import_from=json_path)
+    assert repository.run_import(cancelled=lambda: True) is None
+    assert not repository.needs_import()  # Once per session
+    repository.load()
+    assert repository.notes == []
+    repository.put_note(_note(1, title="typed meanwhile"))
+    assert [note["id"] for note in repository.search("meanwhile")] == ["n1"]
+    repository.close()
+
+    reopened = SqliteNoteRepository(db_path, import_from=json_path)
+    assert reopened.needs_import()
+    reopened.load()  # Imports on its own when nobody did first
+    assert len(reopened.notes) == 1200
+    reopened.close()
+
+
+_V0_SCHEMA = """
+CREATE TABLE notes (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT '',
+    color TEXT,
+    favorite INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE TABLE category_colors (category TEXT PRIMARY KEY, color TEXT NOT NULL);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIRTUAL TABLE notes_fts USING fts5 (
+    title, category, body, content='notes', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts (rowid, title, category, body) VALUES (new.rowid, new.title, new.category, new.body);
+END;
+CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, old.body);
+END;
+CREATE TRIGGER notes_fts_update AFTER UPDATE OF title, category, body ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, title, category, body)
+    VALUES ('delete', old.rowid, old.title, old.category, old.body);
+    INSERT INTO notes_fts (rowid, title, category, body) VALUES (new.rowid, new.title, new.category, new.body);
+END;
+"""
+
+LONG_BODY = " ".join("word%d" % i for i in range(COMPRESS_MIN_LENGTH // 4)) + " needleinthebody"
+
+
+def _body_type(path, note_id):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT typeof(body) FROM notes WHERE id = ?", (note_id,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def _search_ids(repository, query):
+    return [note["id"] for note in repository.search(query)]
+
+
+def test_upgrades_a_version_0_database(tmp_path):
+    path = str(tmp_path / "notes.db")
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(_V0_SCHEMA)
+    except sqlite3.OperationalError:
+        pytest.skip("this SQLite has no FTS5 trigram tokenizer")
+    db.executemany("INSERT INTO notes (id, position, title, body, category) VALUES (?, ?, ?, ?, ?)",
+                   [("short", 1, "Short", "a short body", "work"), ("long", 2, "Long", LONG_BODY, "")])
+    db.commit()
+    db.close()
+    assert len(LONG_BODY) >= COMPRESS_MIN_LENGTH
+
+    repository = SqliteNoteRepository(path)
+    repository.load(limit=10)
+    assert _body_type(path, "short") == "text" and _body_type(path, "long") == "blob"
+    short, long = repository.get("short"), repository.get("long")
+    assert "notes" not in long and long["preview"] == LONG_BODY[:PREVIEW_LENGTH]
+    repository.load_body(long)
+    assert long["notes"] == LONG_BODY
+    assert _search_ids(repository, "needleinthe") == ["long"]  # Indexed before the upgrade
+    assert repository.rank(["needleinthebody"]) == ["long"]  # Word index built from the text
+    assert short["preview"] == "a short body"
+
+    long["notes"] = LONG_BODY.replace("needleinthebody", "haystackinthebody")
+    repository.put_note(long)  # New triggers decompress the old body to take it out of the index
+    assert _search_ids(repository, "needleinthe") == []
+    assert _search_ids(repository, "haystackinthe") == ["long"]
+    repository.close()
+
+    reopened = SqliteNoteRepository(path)
+    reopened.load()
+    assert reopened.get("long")["notes"].endswith("haystackinthebody")
+    assert reopened._db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    reopened.close()
+
+
+def test_long_bodies_round_trip_compressed(tmp_path):
+    path = str(tmp_path / "notes.db")
+    repository = SqliteNoteRepository(path)
+    repository.load(limit=10)
+    repository.put_note(_note(1, notes=LONG_BODY))
+    repository.put_note(_note(2, notes=LONG_BODY[:COMPRESS_MIN_LENGTH - 1]))
+    assert _body_type(path, "n1") == "blob" and _body_type(path, "n2") == "text"
+    repository.close()
+
+    repository = SqliteNoteRepository(path)
+    repository.load(limit=10)
+    note = repository.get("n1")
+    assert "notes" not in note and note["preview"] == LONG_BODY[:PREVIEW_LENGTH]
+    repository.load_body(note)
+    assert note["notes"] == LONG_BODY
+    repository.unload_body(note)
+    repository.load_body(note)
+    assert note["notes"] == LONG_BODY
+    if repository.has_fts:
+        assert _search_ids(repository, "needleinthe") == ["n1"]
+    assert repository.rank(["needleinthebody"]) == ["n1"]
+    assert [n["notes"] for n in repository.export_notes() if n["id"] == "n1"] == [LONG_BODY]
+    repository.close()
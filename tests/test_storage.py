@@ -0,0 +1,209 @@
+import json
+import os
+import time
+
+from muze.codecs import CODECS, detect
+from muze.repository import JsonNoteRepository
+from muze.storage import JournalStore, atomic_write
+
+
+def _write(path, data, **kwargs):
+    with open(path, "w") as f:
+        json.dump(data, f, **kwargs)
+
+
+def test_detect_tells_pretty_json_apart():
+    data = {"notes": [{"id": "a", "title": "t"}], "category_colors": {}}
+    assert detect(CODECS["json"].dumps(data)).name == "json"
+    assert detect(CODECS["json-pretty"].dumps(data)).name == "json-pretty"
+    assert detect(CODECS["columnar"].dumps(data)).name == "columnar"
+
+
+def test_legacy_indented_snapshot_is_rewritten_compact(tmp_path):
+    path = str(tmp_path / "notes.json")
+    _write(path, {"notes": [{"id": "a", "title": "t"}], "category_colors": {}}, indent=4)
+    store = JournalStore(path, lambda: ([], {}))
+    notes, _ = store.load()
+    assert [note["id"] for note in notes] == ["a"]
+    assert store.needs_compaction
+
+
+def test_snapshot_in_store_format_is_left_alone(tmp_path):
+    path = str(tmp_path / "notes.json")
+    for codec in ("json", "json-pretty"):
+        with open(path, "wb") as f:
+            f.write(CODECS[codec].dumps({"notes": [{"id": "a"}], "category_colors": {}}))
+        store = JournalStore(path, lambda: ([], {}), codec=codec)
+        store.load()
+        assert not store.needs_compaction, codec
+
+
+class _State:
+    """The notes a JournalStore snapshots, kept in step with what's logged."""
+
+    def __init__(self):
+        self.notes = {}
+
+    def __call__(self):
+        return list(self.notes.values()), {}
+
+    def put(self, store, note):
+        self.notes[note["id"]] = note
+        store.put_note(note)
+
+    def delete(self, store, note_id):
+        del self.notes[note_id]
+        store.delete_note(note_id)
+
+
+def _open(path, state=None):
+    store = JournalStore(path, state or _State())
+    notes, _ = store.load()
+    return store, {note["id"]: note["title"] for note in notes}
+
+
+def _lines(path):
+    with open(path, "r") as f:
+        return [line for line in f if line.strip()]
+
+
+def test_log_is_replayed_over_the_snapshot(tmp_path):
+    path = str(tmp_path / "notes.json")
+    state = _State()
+    store, _ = _open(path, state)
+    store.compact()  # A first snapshot
+    store.close()
+    store, _ = _open(path, state)
+    state.put(store, {"id": "a", "title": "one"})
+    state.put(store, {"id": "b", "title": "two"})
+    state.put(store, {"id": "a", "title": "one, edited"})
+    state.delete(store, "b")
+    store.close()
+    assert _open(path)[1] == {"a": "one, edited"}
+
+
+def test_interrupted_compaction_keeps_the_old_log(tmp_path):
+    path = str(tmp_path / "notes.json")
+    with open(path, "w") as f:
+        json.dump({"notes": [{"id": "a", "title": "snapshot"}], "category_colors": {}}, f)
+    # Rotated away for a snapshot that never got written, then more edits
+    with open(path + ".log.old", "w") as f:
+        f.write(json.dumps({"op": "put", "note": {"id": "a", "title": "old log"}}) + "\n")
+        f.write(json.dumps({"op": "put", "note": {"id": "b", "title": "old log"}}) + "\n")
+    with open(path + ".log", "w") as f:
+        f.write(json.dumps({"op": "put", "note": {"id": "b", "title": "new log"}}) + "\n")
+        f.write(json.dumps({"op": "put", "note": {"id": "c", "title": "new log"}}) + "\n")
+
+    state = _State()
+    store, titles = _open(path, state)
+    assert titles == {"a": "old log", "b": "new log", "c": "new log"}
+    assert store.needs_compaction
+
+    # A second compaction that's interrupted too still loses nothing
+    state.notes = {note_id: {"id": note_id, "title": title} for note_id, title in titles.items()}
+    store._write_snapshot = lambda data: None
+    store.compact()
+    store._compactor.join()
+    assert os.path.exists(path + ".log.old") and not os.path.exists(path + ".log")
+    assert _open(path)[1] == titles
+
+    store, _ = _open(path, state)
+    store.compact()
+    store.close()
+    assert not os.path.exists(path + ".log.old")
+    assert _open(path)[1] == titles
+
+
+def test_torn_last_line_is_skipped_and_not_glued_to(tmp_path):
+    path = str(tmp_path / "notes.json")
+    state = _State()
+    store, _ = _open(path, state)
+    store.compact()
+    state.put(store, {"id": "a", "title": "kept"})
+    store.close()
+    with open(path + ".log", "a") as f:
+        f.write('{"op": "put", "note": {"id": "b", "tit')  # Crashed mid-write
+
+    store, titles = _open(path, state)
+    assert titles == {"a": "kept"}
+    state.put(store, {"id": "c", "title": "after the crash"})
+    store.close()
+    assert _open(path)[1] == {"a": "kept", "c": "after the crash"}
+
+
+def test_failed_snapshot_write_leaves_the_old_one(tmp_path):
+    path = str(tmp_path / "notes.json")
+    with open(path, "w") as f:
+        json.dump({"notes": [{"id": "a", "title": "old"}], "category_colors": {}}, f)
+
+    def write(f):
+        f.write('{"notes": [')
+        raise OSError("disk full")
+
+    try:
+        atomic_write(path, write)
+    except OSError:
+        pass
+    assert _open(path)[1] == {"a": "old"}
+
+    atomic_write(path, lambda f: json.dump({"notes": [{"id": "a", "title": "new"}]}, f))
+    assert _open(path)[1] == {"a": "new"}
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_changes_to_a_note_are_coalesced_into_one_append(tmp_path, monkeypatch):
+    path = str(tmp_path / "notes.json")
+    state = _State()
+    store, _ = _open(path, state)
+    store.compact()
+    store._compactor.join()
+    store.flush_delay = 60  # Only the explicit flush below writes
+    note = {"id": "a", "title": "toggled", "favorite": False}
+    for _ in range(5):
+        note = dict(note, favorite=not note["favorite"])
+        state.put(store, note)
+    state.put(store, {"id": "b", "title": "other"})
+    assert not os.path.exists(path + ".log")
+
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+    store.flush()
+    assert len(fsyncs) == 1
+    assert len(_lines(path + ".log")) == 2
+    store.close()
+    notes, _ = JournalStore(path, None).load()
+    assert {note["id"]: note.get("favorite") for note in notes} == {"a": True, "b": None}
+
+
+def test_timer_flushes_without_being_asked(tmp_path):
+    path = str(tmp_path / "notes.json")
+    state = _State()
+    store, _ = _open(path, state)
+    store.compact()
+    store._compactor.join()
+    store.flush_delay = 0.05
+    state.put(store, {"id": "a", "title": "soon on disk"})
+    deadline = time.time() + 5
+    while not os.path.exists(path + ".log") and time.time() < deadline:
+        time.sleep(0.01)
+    assert _open(path)[1] == {"a": "soon on disk"}  # Read while the store is still open
+    store.close()
+
+
+def test_repository_edits_survive_close_without_a_flush(tmp_path):
+    path = str(tmp_path / "notes.json")
+    repository = JsonNoteRepository(path)
+    repository.load()
+    note = {"id": "a", "title": "t", "notes": "", "category": "", "favorite": False}
+    repository.put_note(note)
+    repository.set_favorite(note, True)
+    repository.close()
+
+    reopened = JsonNoteRepository(path)
+    reopened.load()
+    assert reopened.get("a")["favorite"] is True
+    reopened.put_note({"id": "b", "title": "before pausing", "notes": "", "category": ""})
+    reopened.flush()  # What the app does in on_pause
+    assert "b" in _open(path)[1]
+    reopened.close()
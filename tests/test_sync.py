@@ -0,0 +1,114 @@
+import pytest
+
+from muze.repository import JsonNoteRepository
+from muze.sqlite_repository import SqliteNoteRepository
+from muze.sync import FolderPeer, SyncEngine
+
+N = 50
+
+
+def _note(index):
+    return {"id": "n%d" % index, "title": "note %d" % index, "url": "", "notes": "body %d" % index,
+            "category": "", "color": None, "favorite": False}
+
+
+class Device:
+    def __init__(self, kind, directory, name):
+        self.kind, self.directory, self.name = kind, directory, name
+        self.open()
+
+    def open(self):
+        if self.kind == "json":
+            self.repository = JsonNoteRepository(str(self.directory / "notes.json"))
+        else:
+            self.repository = SqliteNoteRepository(str(self.directory / "notes.db"))
+        self.repository.load()
+        self.engine = SyncEngine(self.repository, str(self.directory / "notes.sync"), device=self.name)
+
+    def close(self, engine=True):
+        if engine:
+            self.engine.close()
+        self.repository.close()
+
+    def titles(self):
+        return {note["id"]: note["title"] for note in self.repository.export_notes()}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def devices(request, tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    a = Device(request.param, tmp_path / "a", "a")
+    b = Device(request.param, tmp_path / "b", "b")
+    for index in range(N):
+        a.repository.put_note(_note(index))
+    peer = FolderPeer(str(tmp_path / "peer"))
+    assert a.engine.sync(peer) == (N, 0)
+    assert b.engine.sync(peer) == (0, N)
+    yield a, b, peer
+    a.close()
+    b.close()
+
+
+def test_only_changed_notes_are_exchanged(devices):
+    a, b, peer = devices
+    for index in (3, 17, 42):
+        note = a.repository.get("n%d" % index)
+        note["title"] = "edited %d" % index
+        a.repository.put_note(note)
+    assert a.engine.pending() == 3
+    assert a.engine.sync(peer) == (3, 0)
+    assert b.engine.sync(peer) == (0, 3)
+    assert b.titles() == a.titles()
+    assert a.engine.sync(peer) == (0, 0)
+    b.close()
+    b.open()
+    assert b.engine.pending() == 0  # Merged notes aren't taken for local edits
+
+
+def test_changes_made_while_not_watching_are_pushed(devices):
+    a, b, peer = devices
+    a.close()
+    a.open()
+    a.engine.close()  # Edits below happen with nobody watching
+    note = a.repository.get("n1")
+    note["title"] = "edited offline"
+    a.repository.put_note(note)
+    a.repository.delete_note(a.repository.get("n2"))
+    a.repository.put_note(_note(N))
+    a.close(engine=False)
+    a.open()
+    assert a.engine.pending() == 3
+    assert a.engine.sync(peer) == (3, 0)
+    assert b.engine.sync(peer) == (0, 3)
+    assert b.titles() == a.titles()
+    assert "n2" not in b.titles() and b.titles()["n1"] == "edited offline"
+
+
+def test_note_gone_unnoticed_is_pushed_as_a_delete(devices):
+    a, b, peer = devices
+    note = a.repository.get("n5")
+    note["title"] = "edited"
+    a.repository.put_note(note)
+    a.repository.unwatch(a.engine.on_note_changed)
+    a.repository.delete_note(note)
+    a.repository.watch(a.engine.on_note_changed)
+    assert a.engine.sync(peer) == (1, 0)
+    b.engine.sync(peer)
+    assert "n5" not in b.titles()
+    assert a.engine.sync(peer) == (0, 0)
+
+
+@pytest.mark.parametrize("record", [
+    [1, 2],
+    {"id": "n1"},
+    {"id": "n1", "values": {"title": "x"}, "stamps": {"title": 5}},
+    {"id": "n1", "values": {"title": "x"}, "stamps": {"title": ["soon", "a"]}},
+])
+def test_malformed_records_are_refused_untouched(devices, record):
+    a, b, peer = devices
+    before = b.titles()
+    with pytest.raises(ValueError):
+        b.engine.merge(record)
+    assert b.titles() == before
+    assert b.engine.pending() == 0